@@ -0,0 +1,51 @@
+"""
+Benchmark of plain against accelerated CP-ALS.
+
+Runs ``cp`` with the "als" and "accelerated_als" algorithms from the same
+random starts on the bundled bread, claus and amino acid tensors, and
+compares the iterations and wall time needed to reach the tolerance along
+with the least squares fit reached.
+"""
+from __future__ import print_function
+import time
+import numpy as np
+from functools import reduce
+from tensorlib.datasets import load_bread, load_claus, load_amino
+from tensorlib.decomposition import cp
+from tensorlib.mathutils import mttkrp
+
+
+def relative_fit(X, components):
+    # residual of the least squares solution of the last mode, relative to
+    # the norm of X, as the factors returned by cp are normalized
+    M = mttkrp(X, components, X.ndim - 1)
+    G = reduce(np.multiply, [np.dot(U.T, U) for U in components[:-1]])
+    C = np.linalg.solve(G, M.T).T
+    return (np.sum(X ** 2) - np.sum(M * C)) / np.sum(X ** 2)
+
+
+if __name__ == "__main__":
+    n_starts = 5
+    tol = 1E-8
+    for name, load, n_components in [("brod", load_bread, 4),
+                                     ("claus", load_claus, 3),
+                                     ("amino", load_amino, 3)]:
+        X, meta = load()
+        X = X.astype(np.float64)
+        print("%s %s, %i components, tol=%g, %i random starts"
+              % (name, "x".join(str(d) for d in X.shape), n_components, tol,
+                 n_starts))
+        for algorithm in ["als", "accelerated_als"]:
+            n_iter, times, fits = [], [], []
+            for seed in range(n_starts):
+                t0 = time.time()
+                U, info = cp(X, n_components, tol=tol, max_iter=5000,
+                             init_type="random", random_state=seed,
+                             algorithm=algorithm, return_info=True)
+                times.append(time.time() - t0)
+                n_iter.append(info["n_iter"])
+                fits.append(relative_fit(X, U))
+            print("  %-16s median iterations %5i, median time %.3fs, "
+                  "best relative error %.6f"
+                  % (algorithm, np.median(n_iter), np.median(times),
+                     np.min(fits)))
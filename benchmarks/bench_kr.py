@@ -0,0 +1,56 @@
+"""
+Benchmark of the Khatri-Rao product implementations.
+
+Compares the pairwise ``kr`` and ``_canonical_kr`` folds against
+``kr_many`` computing the whole product at once, and against streaming the
+product in row blocks into a matricized tensor times Khatri-Rao product.
+"""
+from __future__ import print_function
+import time
+import numpy as np
+from functools import reduce
+from tensorlib.mathutils import kr, kr_many, _canonical_kr, matricize
+
+
+def bench(func, n_repeat=3):
+    times = []
+    for i in range(n_repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+if __name__ == "__main__":
+    rs = np.random.RandomState(1999)
+    n_components = 10
+    for shape in [(50, 40, 30), (20, 20, 20, 20), (10, 12, 14, 16, 18)]:
+        matrices = [rs.rand(d, n_components) for d in shape]
+        print("Khatri-Rao product of %s factors with %i columns"
+              % ("x".join(str(d) for d in shape), n_components))
+        print("  pairwise kr:         %.4fs"
+              % bench(lambda: reduce(kr, matrices)))
+        print("  pairwise canonical:  %.4fs"
+              % bench(lambda: reduce(_canonical_kr, matrices)))
+        print("  kr_many:             %.4fs"
+              % bench(lambda: kr_many(matrices)))
+        out = np.empty((int(np.prod(shape)), n_components))
+        print("  kr_many, out buffer: %.4fs"
+              % bench(lambda: kr_many(matrices, out=out)))
+
+        X = rs.rand(7, *shape)
+        X0 = matricize(X, 0)
+        # matricize orders the remaining modes with the last one slowest
+        factors = matrices[::-1]
+
+        def streamed(row_block=4096):
+            res = np.zeros((X0.shape[0], n_components))
+            start = 0
+            for block in kr_many(factors, row_block=row_block):
+                res += np.dot(X0[:, start:start + len(block)], block)
+                start += len(block)
+            return res
+
+        print("  MTTKRP, full product:    %.4fs"
+              % bench(lambda: np.dot(X0, kr_many(factors))))
+        print("  MTTKRP, streamed blocks: %.4fs" % bench(streamed))
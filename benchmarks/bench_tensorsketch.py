@@ -0,0 +1,60 @@
+"""
+Benchmark of TensorSketch CP-ALS against plain CP-ALS.
+
+Decomposes the bundled bread, claus and amino acid tensors, along with a
+larger synthetic low rank tensor, with increasing sketch sizes. Reports
+the relative error of the returned model on the full tensor, the time
+spent sketching X and the total wall time.
+"""
+from __future__ import print_function
+import time
+import numpy as np
+from functools import reduce
+from tensorlib.datasets import load_bread, load_claus, load_amino
+from tensorlib.decomposition import cp
+from tensorlib.mathutils import kr_many, matricize, mttkrp
+
+
+def relative_error(X, components):
+    X_hat = np.dot(components[0], kr_many(components[1:][::-1]).T)
+    return np.sum((matricize(X, 0) - X_hat) ** 2) / np.sum(X ** 2)
+
+
+def als_relative_error(X, components):
+    # the factors returned by ALS are normalized, so the last mode is solved
+    # for to measure the error of the model
+    M = mttkrp(X, components, X.ndim - 1)
+    G = reduce(np.multiply, [np.dot(U.T, U) for U in components[:-1]])
+    return relative_error(X, components[:-1] +
+                          [np.linalg.solve(G, M.T).T])
+
+
+def synthetic(shape=(300, 200, 100), n_components=5, noise=.01):
+    rs = np.random.RandomState(1999)
+    U = [rs.rand(d, n_components) for d in shape]
+    X = np.einsum('ir,jr,kr->ijk', *U)
+    return X + noise * X.std() * rs.randn(*shape), {}
+
+
+if __name__ == "__main__":
+    for name, load, n_components in [("brod", load_bread, 3),
+                                     ("claus", load_claus, 3),
+                                     ("amino", load_amino, 3),
+                                     ("synthetic", synthetic, 5)]:
+        X, meta = load()
+        X = X.astype(np.float64)
+        print("%s %s, %i components"
+              % (name, "x".join(str(d) for d in X.shape), n_components))
+        t0 = time.time()
+        U = cp(X, n_components, init_type="random", random_state=0)
+        print("  %-18s relative error %.6f, %.3fs"
+              % ("als", als_relative_error(X, U), time.time() - t0))
+        for sketch_size in [64, 256, 1024, 4096, 16384]:
+            t0 = time.time()
+            U, info = cp(X, n_components, init_type="random",
+                         random_state=0, algorithm="tensorsketch",
+                         sketch_size=sketch_size, return_info=True)
+            print("  sketch_size %-6i relative error %.6f, %.3fs "
+                  "(sketching %.3fs)"
+                  % (sketch_size, relative_error(X, U), time.time() - t0,
+                     info["sketch_time"]))
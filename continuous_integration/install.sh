@@ -15,7 +15,7 @@ export CXX=g++
 
 sudo apt-get update -qq
 if [[ "$INSTALL_ATLAS" == "true" ]]; then
-    sudo apt-get install -qq libatlas3gf-base libatlas-dev
+    sudo apt-get install -qq libatlas3-base libatlas-dev
 fi
 
 if [[ "$DISTRIB" == "conda" ]]; then
@@ -12,8 +12,10 @@ setuptools.setup(
         os.path.abspath(__file__)), 'README.rst')).read(),
     license='BSD 3-clause',
     url='http://github.com/tensorlib/tensorlib/',
-    install_requires=['numpy',
-                      'scipy'],
+    install_requires=['numpy>=1.11',
+                      'scipy>=0.17'],
+    # caps BLAS threads while n_jobs > 1 workers run
+    extras_require={'parallel': ['threadpoolctl']},
     classifiers=['Development Status :: 3 - Alpha',
                  'Intended Audience :: Science/Research',
                  'License :: OSI Approved :: BSD License',
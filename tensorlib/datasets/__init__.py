@@ -1,9 +1,11 @@
 """This module deals with loading datasets."""
 from .datasets import load_bread
 from .datasets import load_claus
+from .datasets import load_amino
 from .datasets import fetch_decmeg
 
 __all__ = ['load_bread',
            'load_claus',
+           'load_amino',
            'fetch_decmeg',
            ]
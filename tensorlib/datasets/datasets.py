@@ -66,6 +66,35 @@ def load_claus():
     return X, meta
 
 
+def load_amino():
+    """
+    Load amino.mat dataset originally from
+    http://www.models.life.ku.dk/Amino_Acid_fluo
+
+    Flourescence excitation-emission spectra of five samples with varying
+    amounts of tryptophane, tyrosine and phenylalanine, the same data as
+    ``load_claus`` along with the concentrations and spectral axes.
+
+    Returns
+    -------
+    X : ndarray, shape = [5, 201, 61]
+    meta : dict
+        Metadata about the dataset. "y" holds the concentration of each
+        amino acid in each sample, and "EmAx" and "ExAx" the emission and
+        excitation wavelengths.
+
+    """
+    module_path = os.path.join(os.path.dirname(__file__), "data")
+    descr = "axis 1: samples, axes 2 & 3: emission-excitation spectra"
+    matfile = os.path.join(module_path, "amino.mat")
+    d = loadmat(matfile)
+    # stored unfolded along the first mode, in Fortran order
+    X = d['X'].reshape(d['DimX'].ravel().astype(int), order='F')
+    meta = {k: d[k] for k in d.keys() if k not in ['X', 'DimX']}
+    meta['DESC'] = descr
+    return X, meta
+
+
 def fetch_decmeg():
     """
     Get and load a subject (subject 4) from the DECMEG dataset.
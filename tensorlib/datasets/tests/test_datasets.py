@@ -1,4 +1,6 @@
 from tensorlib.datasets import load_bread
+from tensorlib.datasets import load_claus
+from tensorlib.datasets import load_amino
 from tensorlib.datasets import fetch_decmeg
 from nose.plugins.skip import SkipTest
 
@@ -8,6 +10,14 @@ def test_fetch_bread():
     load_bread()
 
 
+def test_load_amino():
+    X, meta = load_amino()
+    assert X.shape == (5, 201, 61)
+    assert meta["y"].shape == (5, 3)
+    # same tensor as claus.mat
+    assert (X == load_claus()[0]).all()
+
+
 def test_fetch_decmeg():
     raise SkipTest
     fetch_decmeg()
@@ -1,7 +1,9 @@
 """This module deals with tensor decompositions."""
 from .decomposition import cp
 from .decomposition import tucker
+from .decomposition import hosvd
 
 __all__ = ['cp',
            'tucker',
+           'hosvd',
            ]
@@ -1,33 +1,350 @@
 """Tensor factorization."""
+import time
 import numpy as np
 from scipy import linalg
+from scipy.sparse.linalg import LinearOperator, eigsh
 from functools import reduce
-from ..mathutils import kr, matricize, sign_flip, tmult
-from ..utils import check_random_state, check_tensor
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from ..mathutils import DimensionTree, SlabTensor, TensorSketch
+from ..mathutils import UnfoldingCache
+from ..mathutils import kr, kr_many, matricize, multi_tmult, sign_flip, tmult
+from ..mathutils import unmatricize
+from ..sparse import COOTensor, CSFMTTKRP
+from ..utils import check_random_state, check_tensor, effective_n_jobs
+from ..utils import limit_blas_threads
+
+
+def _check_ranks(X, n_components):
+    """Expand n_components into one rank per mode of X."""
+    if np.isscalar(n_components):
+        return [int(n_components)] * len(X.shape)
+    ranks = [int(r) for r in n_components]
+    if len(ranks) != len(X.shape):
+        raise ValueError("n_components needs one rank per mode of X, got %i "
+                         "for %i modes" % (len(ranks), len(X.shape)))
+    return ranks
 
 
 def _random_init(X, n_components, random_state=None):
     rs = check_random_state(random_state)
-    return [rs.rand(X.shape[i], n_components) for i in range(len(X.shape))]
+    ranks = _check_ranks(X, n_components)
+    return [rs.rand(X.shape[i], ranks[i]) for i in range(len(X.shape))]
 
 
-def _hosvd_init_op(X, n_components, n):
-    XXT = matricize(X, n).dot(matricize(X, n).T)
-    _, U = linalg.eigh(XXT, eigvals=(XXT.shape[0] - n_components,
-                                     XXT.shape[0] - 1))
+def _sparse_hosvd_init_op(X, n_components, n):
+    """
+    Leading eigenvectors of the Gram matrix of a sparse unfolding.
+
+    Lanczos iterations only multiply by the CSR unfolding and its transpose,
+    so memory scales with the number of stored entries instead of the
+    square of the mode size.
+    """
+    Xn = X.unfold(n)
+    size = Xn.shape[0]
+    if n_components >= size - 1:
+        w, U = linalg.eigh(Xn.dot(Xn.T).toarray())
+    else:
+        op = LinearOperator((size, size), dtype=np.float64,
+                            matvec=lambda v: Xn.dot(Xn.T.dot(v)))
+        w, U = eigsh(op, k=n_components, v0=np.ones(size))
+    U = U[:, np.argsort(w)[::-1][:n_components]]
+    return sign_flip(U)
+
+
+def _hosvd_init_op(unfoldings, n_components, n):
+    if isinstance(unfoldings, COOTensor):
+        return _sparse_hosvd_init_op(unfoldings, n_components, n)
+    # the eigvals keyword of eigh is gone in scipy 1.14, so the full
+    # decomposition is sliced instead
+    _, U = linalg.eigh(unfoldings.gram(n))
     # reverse order of eigenvectors such that eigenvalues are decreasing
-    U = U[:, ::-1]
+    U = U[:, ::-1][:, :n_components]
     # flip sign
     U = sign_flip(U)
     return U
 
 
-def _hosvd_init(X, n_components):
-    return [_hosvd_init_op(X, n_components, i)
+def _hosvd_init(X, n_components, unfoldings=None):
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    elif unfoldings is None:
+        unfoldings = UnfoldingCache(X, max_bytes=0)
+    ranks = _check_ranks(X, n_components)
+    return [_hosvd_init_op(unfoldings, ranks[i], i)
             for i in range(len(X.shape))]
 
 
-def _cp3(X, n_components, tol, max_iter, init_type, random_state=None):
+def _randomized_range_finder(A, size, n_iter, random_state=None):
+    """
+    Orthonormal basis approximating the range of A.
+
+    Power iterations sharpen the decay of the spectrum, so the basis
+    captures the leading subspace accurately. Only the short side, with as
+    many rows as A, is renormalized by QR between iterations.
+    """
+    rs = check_random_state(random_state)
+    Q = A.dot(rs.normal(size=(A.shape[1], size)))
+    Q, _ = linalg.qr(Q, mode='economic')
+    for i in range(n_iter):
+        Q, _ = linalg.qr(A.dot(A.T.dot(Q)), mode='economic')
+    return Q
+
+
+def _randomized_hosvd_init(X, n_components, random_state=None,
+                           unfoldings=None, n_oversamples=10, n_iter=2):
+    """
+    HOSVD initialization from randomized SVDs of the unfoldings of X.
+
+    The Gram matrix of each unfolding is never formed; every mode costs a few
+    products of the unfolding with thin matrices of n_components +
+    n_oversamples columns. Sparse unfoldings are multiplied as CSR
+    matrices.
+    """
+    rs = check_random_state(random_state)
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    elif unfoldings is None:
+        unfoldings = UnfoldingCache(X, max_bytes=0)
+    ranks = _check_ranks(X, n_components)
+    components = []
+    for n in range(X.ndim):
+        Xn = unfoldings.unfold(n)
+        if isinstance(X, COOTensor):
+            # empty columns do not change the left singular vectors, and
+            # dropping them bounds the random test matrix by nnz
+            Xn = Xn[:, np.unique(Xn.indices)]
+        size = min(ranks[n] + n_oversamples, *Xn.shape)
+        Q = _randomized_range_finder(Xn, size, n_iter, rs)
+        # left singular vectors of the small projection Q.T Xn, also for a
+        # sparse Xn
+        B = Xn.T.dot(Q).T
+        _, U = linalg.eigh(np.dot(B, B.T))
+        U = U[:, ::-1][:, :ranks[n]]
+        components.append(sign_flip(np.dot(Q, U)))
+    return components
+
+
+def _st_hosvd_order(shape, ranks):
+    """
+    Greedy processing order for ST-HOSVD.
+
+    Every step costs a Gram matrix and a truncation over the current core,
+    so modes that shrink the core by the largest factor go first.
+    """
+    return sorted(range(len(shape)),
+                  key=lambda n: (-float(shape[n]) / ranks[n], -shape[n]))
+
+
+def _truncation_rank(w, max_rank, max_discarded):
+    """
+    Smallest rank whose discarded eigenvalues sum to at most max_discarded.
+
+    ``w`` holds the eigenvalues of a Gram matrix in decreasing order.
+    """
+    # discarded[r - 1] is the energy left out by keeping r components
+    discarded = np.cumsum(w[::-1])[::-1]
+    discarded = np.append(discarded[1:], 0.)
+    rank = int(np.argmax(discarded <= max_discarded)) + 1
+    return min(rank, max_rank)
+
+
+def _st_hosvd(X, n_components, order=None, rank_tol=None):
+    """
+    Sequentially truncated HOSVD, returning the core and the mode bases.
+
+    If ``rank_tol`` is given, each mode keeps the fewest components for
+    which the discarded part of its spectrum stays within an equal share of
+    the relative error budget ``rank_tol``, with ``n_components`` (if any)
+    as an upper bound.
+    """
+    if n_components is None:
+        ranks = list(X.shape)
+    else:
+        ranks = _check_ranks(X, n_components)
+    if order is None:
+        order = _st_hosvd_order(X.shape, ranks)
+    elif sorted(order) != list(range(X.ndim)):
+        raise ValueError("order must be a permutation of the modes of X")
+    if rank_tol is not None:
+        max_discarded = rank_tol ** 2 * np.sum(X ** 2) / X.ndim
+    G = X
+    components = [None] * X.ndim
+    for n in order:
+        if rank_tol is None:
+            U = _hosvd_init_op(UnfoldingCache(G, max_bytes=0), ranks[n], n)
+        else:
+            Gn = matricize(G, n)
+            w, V = linalg.eigh(Gn.dot(Gn.T))
+            w, V = w[::-1], V[:, ::-1]
+            rank = _truncation_rank(w, ranks[n], max_discarded)
+            U = sign_flip(V[:, :rank])
+        G = tmult(G, U.T, n)
+        components[n] = U
+    return G, components
+
+
+def _initialize(X, n_components, init_type, random_state=None,
+                unfoldings=None):
+    if isinstance(X, SlabTensor) and init_type not in ("random", "hosvd"):
+        raise ValueError("Only 'random' and 'hosvd' initializations are "
+                         "supported for out of core tensors, got %r"
+                         % init_type)
+    if isinstance(X, COOTensor) and init_type == "st_hosvd":
+        raise ValueError("The 'st_hosvd' initialization is not supported "
+                         "for sparse tensors")
+    if init_type == "random":
+        return _random_init(X, n_components, random_state)
+    elif init_type == "hosvd":
+        return _hosvd_init(X, n_components, unfoldings)
+    elif init_type == "st_hosvd":
+        return _st_hosvd(X, n_components)[1]
+    elif init_type == "randomized_hosvd":
+        return _randomized_hosvd_init(X, n_components, random_state,
+                                      unfoldings)
+    raise ValueError("init_type must be one of 'random', 'hosvd', "
+                     "'st_hosvd' or 'randomized_hosvd', got %r" % init_type)
+
+
+# Largest condition number of a Gram product that is solved by Cholesky,
+# beyond which the eigendecomposition path is used instead.
+_CHOLESKY_MAX_COND = 1. / np.sqrt(np.finfo(float).eps)
+
+
+def _cholesky_solve(M, G):
+    """Solve R G = M for R, or return None if G is not well conditioned."""
+    try:
+        c, lower = linalg.cho_factor(G)
+    except linalg.LinAlgError:
+        return None
+    # The squared ratio of the pivots is a cheap lower bound on cond(G)
+    d = np.abs(np.diag(c))
+    if d.min() ** 2 * _CHOLESKY_MAX_COND < d.max() ** 2:
+        return None
+    return linalg.cho_solve((c, lower), M.T).T
+
+
+def _eigh_solve(M, G):
+    """Solve R G = M for R with a truncated eigendecomposition of G."""
+    w, V = linalg.eigh(G)
+    keep = w > w.max() * len(w) * np.finfo(float).eps
+    return np.dot(np.dot(M, V[:, keep]) / w[keep], V[:, keep].T)
+
+
+def _pinv_solve(M, G):
+    """Solve R G = M for R with the pseudo-inverse of G."""
+    return np.dot(M, linalg.pinv(G))
+
+
+_GRAM_SOLVERS = {"cholesky": _cholesky_solve,
+                 "eigh": _eigh_solve,
+                 "pinv": _pinv_solve}
+
+
+def _solve_gram(M, G, solver="cholesky", ridge=0., info=None):
+    """
+    Solve the normal equations R (G + ridge * I) = M of one ALS mode update.
+
+    Solvers may return None when G is too ill-conditioned for them, in which
+    case the eigendecomposition path is used and counted in
+    ``info["n_fallbacks"]``.
+    """
+    if ridge > 0:
+        G = G + ridge * np.eye(G.shape[0])
+    res = _GRAM_SOLVERS[solver](M, G)
+    if res is None:
+        if info is not None:
+            info["n_fallbacks"] += 1
+        res = _eigh_solve(M, G)
+    return res
+
+
+class _DirectMTTKRP(object):
+    """
+    MTTKRP engine without memoization, for tensor types that implement
+    ``mttkrp(factors, axis)`` themselves.
+    """
+    nbytes = 0
+
+    def __init__(self, X, factors):
+        self.X = X
+        self.factors = list(factors)
+
+    def update(self, axis, factor):
+        self.factors[axis] = factor
+
+    def mttkrp(self, axis):
+        return self.X.mttkrp(self.factors, axis)
+
+
+def _mttkrp_engine(X, factors, csf="per_mode", n_jobs=1):
+    """MTTKRP engine suited to the type of X."""
+    if isinstance(X, COOTensor) and csf is not None:
+        return CSFMTTKRP(X, factors, csf)
+    elif isinstance(X, (SlabTensor, COOTensor)):
+        return _DirectMTTKRP(X, factors)
+    elif effective_n_jobs(n_jobs) > 1:
+        return DimensionTree(_parallel_slabs(X, n_jobs), factors)
+    return DimensionTree(X, factors)
+
+
+def _sq_norm(X):
+    """Squared Frobenius norm of a dense, out-of-core or sparse tensor."""
+    if isinstance(X, (SlabTensor, COOTensor)):
+        return X.sq_norm()
+    return np.sum(X ** 2)
+
+
+def _residual_rows(X0, U0, p, block_bytes=2 ** 26):
+    """
+    Squared norm of X0 - U0 p^T, over blocks of rows so that no temporary
+    larger than about block_bytes is allocated.
+    """
+    step = max(1, block_bytes // max(8 * X0.shape[1], 1))
+    return sum(np.sum((X0[start:start + step] -
+                       np.dot(U0[start:start + step], p.T)) ** 2)
+               for start in range(0, X0.shape[0], step))
+
+
+def _cp_residual(X, components):
+    """Squared residual of a CP model from its explicit reconstruction."""
+    if isinstance(X, COOTensor):
+        # Only the stored entries are compared explicitly, the model energy
+        # elsewhere comes from the Gram matrices.
+        m = X.values_at(components)
+        model_sq = np.sum(reduce(np.multiply,
+                                 [np.dot(U.T, U) for U in components]))
+        return np.sum((X.data - m) ** 2) + max(model_sq - np.sum(m ** 2), 0.)
+    # Reshaping X along its first mode keeps the last mode fastest, which
+    # matches the Khatri-Rao product of the other factors in their own order
+    # and is a view of C ordered X, unlike matricize.
+    p = kr_many(components[1:])
+    if isinstance(X, SlabTensor):
+        return sum(_residual_rows(slab.reshape(stop - start, -1),
+                                  components[0][start:stop], p)
+                   for start, stop, slab in X.slabs())
+    return _residual_rows(X.reshape(X.shape[0], -1), components[0], p)
+
+
+def _cp_error(X, X_sq, components, grams, last_mttkrp):
+    """
+    Squared residual of a CP model, ||X||^2 - 2 <X, M> + ||M||^2.
+
+    <X, M> comes from the MTTKRP of the last mode and ||M||^2 from the
+    Hadamard product of the Gram matrices, so the cost does not depend on the
+    size of X. If the terms cancel down to the rounding error of ||X||^2 the
+    residual is recomputed from the explicit reconstruction.
+    """
+    inner = np.sum(last_mttkrp * components[-1])
+    model_sq = np.sum(reduce(np.multiply, grams))
+    err = X_sq - 2 * inner + model_sq
+    if err < np.sqrt(np.finfo(float).eps) * X_sq:
+        err = _cp_residual(X, components)
+    return err
+
+
+def _cp3(X, n_components, tol, max_iter, init_type, random_state=None,
+         solver="cholesky", ridge=0.):
     """
     3 dimensional CANDECOMP/PARAFAC decomposition.
 
@@ -38,16 +355,15 @@ def _cp3(X, n_components, tol, max_iter, init_type, random_state=None):
     if len(X.shape) != 3:
         raise ValueError("CP3 decomposition only supports 3 dimensions!")
 
-    if init_type == "random":
-        A, B, C = _random_init(X, n_components, random_state)
-    elif init_type == "hosvd":
-        A, B, C = _hosvd_init(X, n_components)
+    A, B, C = _initialize(X, n_components, init_type, random_state)
     grams = [np.dot(arr.T, arr) for arr in (A, B, C)]
     err = 1E10
+    X_sq = np.sum(X ** 2)
 
     for itr in range(max_iter):
         err_old = err
-        A = matricize(X, 0).dot(kr(C, B)).dot(linalg.pinv(grams[1] * grams[2]))
+        A = _solve_gram(matricize(X, 0).dot(kr(C, B)), grams[1] * grams[2],
+                        solver, ridge)
         if itr == 0:
             normalization = np.sqrt((A ** 2).sum(axis=0))
         else:
@@ -56,7 +372,8 @@ def _cp3(X, n_components, tol, max_iter, init_type, random_state=None):
         A /= normalization
         grams[0] = np.dot(A.T, A)
 
-        B = matricize(X, 1).dot(kr(C, A)).dot(linalg.pinv(grams[0] * grams[2]))
+        B = _solve_gram(matricize(X, 1).dot(kr(C, A)), grams[0] * grams[2],
+                        solver, ridge)
         if itr == 0:
             normalization = np.sqrt((B ** 2).sum(axis=0))
         else:
@@ -65,7 +382,8 @@ def _cp3(X, n_components, tol, max_iter, init_type, random_state=None):
         B /= normalization
         grams[1] = np.dot(B.T, B)
 
-        C = matricize(X, 2).dot(kr(B, A)).dot(linalg.pinv(grams[0] * grams[1]))
+        M = matricize(X, 2).dot(kr(B, A))
+        C = _solve_gram(M, grams[0] * grams[1], solver, ridge)
         if itr == 0:
             normalization = np.sqrt((C ** 2).sum(axis=0))
         else:
@@ -74,7 +392,7 @@ def _cp3(X, n_components, tol, max_iter, init_type, random_state=None):
         C /= normalization
         grams[2] = np.dot(C.T, C)
 
-        err = linalg.norm(matricize(X, 0) - np.dot(A, kr(C, B).T)) ** 2
+        err = _cp_error(X, X_sq, [A, B, C], grams, M)
         thresh = np.abs(err - err_old) / err_old
         if thresh < tol:
             break
@@ -82,55 +400,904 @@ def _cp3(X, n_components, tol, max_iter, init_type, random_state=None):
     return A, B, C
 
 
-def _cpN(X, n_components, tol, max_iter, init_type, random_state=None):
-    """Generalized CANDECOMP/PARAFAC decomposition."""
-    if init_type == "random":
-        components = _random_init(X, n_components, random_state)
-    elif init_type == "hosvd":
-        components = _hosvd_init(X, n_components)
+def _cpN(X, n_components, tol, max_iter, init_type, random_state=None,
+         solver="cholesky", ridge=0., cache_bytes=0, csf="per_mode",
+         n_jobs=1, callback=None, line_search=None, algorithm="als",
+         n_samples=None, sketch_size=None, nonnegative=False, mask=None):
+    """
+    Generalized CANDECOMP/PARAFAC decomposition.
+
+    If given, ``callback(itr, fit, thresh)`` is called after every iteration
+    with the least squares residual ``fit`` of the current model, and stops
+    the decomposition early by returning True. Unlike the error of the
+    normalized factors, ``fit`` is comparable between runs.
+    """
+    if mask is not None:
+        return _cp_missing(X, mask, n_components, tol, max_iter, init_type,
+                           random_state, solver=solver, ridge=ridge,
+                           cache_bytes=cache_bytes, callback=callback)
+    if nonnegative:
+        return _cp_nonnegative(X, n_components, tol, max_iter, init_type,
+                               random_state, cache_bytes=cache_bytes,
+                               csf=csf, n_jobs=n_jobs, callback=callback,
+                               update="mu" if nonnegative == "mu" else "hals")
+    if algorithm == "lm":
+        return _cp_lm(X, n_components, tol, max_iter, init_type,
+                      random_state, cache_bytes=cache_bytes, csf=csf,
+                      n_jobs=n_jobs, callback=callback)
+    elif algorithm == "randomized":
+        return _cp_randomized(X, n_components, tol, max_iter, init_type,
+                              random_state, solver=solver, ridge=ridge,
+                              cache_bytes=cache_bytes, n_samples=n_samples,
+                              callback=callback)
+    elif algorithm == "tensorsketch":
+        return _cp_tensorsketch(X, n_components, tol, max_iter, init_type,
+                                random_state, solver=solver, ridge=ridge,
+                                cache_bytes=cache_bytes,
+                                sketch_size=sketch_size, callback=callback)
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    else:
+        unfoldings = UnfoldingCache(X, cache_bytes)
+    components = _initialize(X, n_components, init_type, random_state,
+                             unfoldings)
     grams = [np.dot(arr.T, arr) for arr in components]
+    tree = _mttkrp_engine(X, components, csf, n_jobs)
     err = 1E10
+    X_sq = _sq_norm(X)
+    info = {"solver": solver, "ridge": ridge, "n_fallbacks": 0,
+            "history": [], "times": [], "line_search_accepted": []}
+    if algorithm == "accelerated_als":
+        info["n_restarts"] = 0
+    previous = None
+    exponent = 3.
+    momentum = 1.
+    fit = np.inf
+    t0 = time.time()
 
     for itr in range(max_iter):
         err_old = err
 
-        for idx in range(len(components)):
-            components_sublist = [components[n] for n in range(len(components))
-                                  if n != idx]
-            grams_sublist = [grams[n] for n in range(len(components))
-                             if n != idx]
-            p1 = reduce(kr, components_sublist[:-1][::-1],
-                        components_sublist[-1])
-            p2 = linalg.pinv(reduce(np.multiply, grams_sublist, 1.))
-            res = np.dot(matricize(X, idx), p1).dot(p2)
-            if itr == 0:
-                normalization = np.sqrt((res ** 2).sum(axis=0))
+        if algorithm == "accelerated_als" and itr > 1:
+            # Nesterov momentum, restarted when the fit gets worse
+            current = [c.copy() for c in components]
+            momentum_old = momentum
+            momentum = (1. + np.sqrt(1. + 4. * momentum ** 2)) / 2.
+            beta = (momentum_old - 1.) / momentum
+            for idx in range(len(components)):
+                components[idx] = current[idx] + beta * (current[idx] -
+                                                         previous[idx])
+                grams[idx] = np.dot(components[idx].T, components[idx])
+                tree.update(idx, components[idx])
+            normalization = _als_sweep(components, grams, tree, itr,
+                                       solver, ridge, info)
+            M = tree.mttkrp(len(components) - 1)
+            fit_new = X_sq - np.sum(M * components[-1] * normalization)
+            if fit_new > fit:
+                info["n_restarts"] += 1
+                momentum = 1.
+                components[:] = current
+                grams[:] = [np.dot(c.T, c) for c in current]
+                for idx, res in enumerate(current):
+                    tree.update(idx, res)
+                normalization = _als_sweep(components, grams, tree, itr,
+                                           solver, ridge, info)
+                M = tree.mttkrp(len(components) - 1)
+                fit_new = X_sq - np.sum(M * components[-1] * normalization)
+            previous = current
+            fit = fit_new
+        else:
+            if algorithm == "accelerated_als":
+                previous = [c.copy() for c in components]
+            normalization = _als_sweep(components, grams, tree, itr,
+                                       solver, ridge, info)
+            M = tree.mttkrp(len(components) - 1)
+            # least squares residual of the sweep, before normalization
+            fit = X_sq - np.sum(M * components[-1] * normalization)
+
+        err = _cp_error(X, X_sq, components, grams, M)
+        thresh = np.abs(err - err_old) / err_old
+        if thresh >= tol and line_search is not None and itr > 1 and \
+                (itr + 1) % line_search == 0:
+            # Bro's step itr ** (1 / exponent), shortened after failures
+            res = _line_search(X, X_sq, components, grams, previous, tree,
+                               itr ** (1. / exponent), fit, solver, ridge,
+                               info)
+            if res is not None:
+                fit, err = res
+                info["line_search_accepted"].append(itr)
             else:
-                normalization = res.max(axis=0)
-                normalization[normalization < 1] = 1
-            res /= normalization
-            components[idx] = res
-            grams[idx] = np.dot(res.T, res)
-
-        err = linalg.norm(matricize(X, 0) - np.dot(
-            components[0], reduce(kr, components[1:-1][::-1],
-                                  components[-1]).T)) ** 2
+                exponent += 1
+        if line_search is not None:
+            previous = [c.copy() for c in components]
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
+        if thresh < tol:
+            break
+        if callback is not None and callback(itr, fit, thresh):
+            info["stopped_early"] = True
+            break
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    info["fit"] = fit
+    info["cache_nbytes"] = tree.nbytes
+    if isinstance(X, SlabTensor):
+        info["chunk_throughput"] = X.throughput
+    elif isinstance(unfoldings, UnfoldingCache):
+        info["unfold_cache_nbytes"] = unfoldings.nbytes
+    if isinstance(getattr(tree, "X", None), SlabTensor):
+        _slab_info(info, tree.X, lambda: tree.X.mttkrp(components, 0))
+        tree.X.close()
+    return components, info
+
+
+# Restarts whose relative change in error falls below this multiple of tol
+# are considered converged, and are stopped if their least squares residual
+# is more than _RESTART_MARGIN above the current residual of another
+# restart. ALS never increases the residual, so that restart is sure to end
+# up better.
+_RESTART_CONVERGED = 10.
+_RESTART_MARGIN = 0.05
+
+
+def _cp_multi_start(X, n_components, n_init, n_jobs, tol, init_type,
+                    random_state=None, **kwargs):
+    """
+    Run CP from n_init starting points and keep the lowest residual.
+
+    Restarts run on a thread pool, so X is shared by all of them without
+    copies. The first restart uses init_type and the others random starts,
+    unless init_type is itself randomized. Restarts are compared by the
+    least squares residual "fit", since the error of the normalized factors
+    leaves out their scale, and by "err" for the algorithms whose error is
+    already the residual.
+    """
+    rs = check_random_state(random_state)
+    seeds = rs.randint(np.iinfo(np.int32).max, size=n_init)
+    extra_init = init_type if init_type == "randomized_hosvd" else "random"
+    state = {"best": np.inf}
+
+    def stop(itr, fit, thresh):
+        state["best"] = min(state["best"], fit)
+        return (thresh < _RESTART_CONVERGED * tol and
+                fit > (1. + _RESTART_MARGIN) * state["best"])
+
+    def run(i):
+        t0 = time.time()
+        components, info = _cpN(X, n_components, tol=tol,
+                                init_type=init_type if i == 0 else extra_init,
+                                random_state=seeds[i], callback=stop,
+                                **kwargs)
+        info["time"] = time.time() - t0
+        return components, info
+
+    n_jobs = min(effective_n_jobs(n_jobs), n_init)
+    if n_jobs > 1:
+        pool = ThreadPool(n_jobs)
+        try:
+            with limit_blas_threads(max(1, cpu_count() // n_jobs)):
+                results = pool.map(run, range(n_init))
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [run(i) for i in range(n_init)]
+
+    fits = [info.get("fit", info["err"]) for _, info in results]
+    best = int(np.argmin(fits))
+    components, info = results[best]
+    info = dict(info)
+    info["best_run"] = best
+    info["runs"] = [{"init_type": init_type if i == 0 else extra_init,
+                     "random_state": seeds[i],
+                     "n_iter": run_info["n_iter"],
+                     "err": run_info["err"],
+                     "fit": fits[i],
+                     "time": run_info["time"],
+                     "stopped_early": run_info.get("stopped_early", False)}
+                    for i, (_, run_info) in enumerate(results)]
+    return components, info
+
+
+def _parallel_slabs(X, n_jobs):
+    """Split an in-memory X into one slab per worker along its first mode."""
+    n_jobs = effective_n_jobs(n_jobs)
+    return SlabTensor(X, max(1, X.nbytes // n_jobs), n_jobs)
+
+
+def _close_slabs(*tensors):
+    """Stop the thread pools of the SlabTensors among tensors."""
+    for X in tensors:
+        if isinstance(X, SlabTensor):
+            X.close()
+
+
+def _slab_info(info, X, work):
+    """
+    Add the timings of the passes over the slabs of X to info.
+
+    "pass_time" is the mean elapsed seconds of the passes made so far. With
+    a thread pool, ``work()``, which makes one representative pass, is
+    timed once on a single thread and once on the pool, and their ratio is
+    given in "parallel_speedup".
+    """
+    info["pass_time"] = X.wall_time / max(X.n_passes, 1)
+    if X.n_jobs > 1:
+        n_jobs = X.n_jobs
+        elapsed = []
+        for jobs in (1, n_jobs):
+            X.n_jobs = jobs
+            t0 = time.time()
+            work()
+            elapsed.append(time.time() - t0)
+        info["parallel_speedup"] = elapsed[0] / max(elapsed[1], 1E-9)
+
+
+def _als_sweep(components, grams, tree, itr, solver="cholesky", ridge=0.,
+               info=None):
+    """
+    Update every factor in turn by least squares, in place.
+
+    Factors are normalized as they are updated, and the normalization of the
+    last factor is returned so that the least squares solution of the last
+    mode is ``components[-1] * normalization``.
+    """
+    for idx in range(len(components)):
+        grams_sublist = [grams[n] for n in range(len(components))
+                         if n != idx]
+        res = _solve_gram(tree.mttkrp(idx),
+                          reduce(np.multiply, grams_sublist, 1.),
+                          solver, ridge, info)
+        if itr == 0:
+            normalization = np.sqrt((res ** 2).sum(axis=0))
+        else:
+            normalization = res.max(axis=0)
+            normalization[normalization < 1] = 1
+        res /= normalization
+        components[idx] = res
+        grams[idx] = np.dot(res.T, res)
+        tree.update(idx, res)
+    return normalization
+
+
+def _line_search(X, X_sq, components, grams, previous, tree, step, fit,
+                 solver="cholesky", ridge=0., info=None):
+    """
+    Extrapolate the factors along their last update, in place.
+
+    All factors but the last move to ``previous + step * (new - previous)``
+    and the last one is solved for given them. The move is kept if the
+    least squares residual of that model, ||X||^2 - <M, C> for the MTTKRP M
+    and the solution C of the last mode, is below ``fit``. Evaluating it
+    costs one MTTKRP. Returns the residual and error of the factors kept, or
+    None if the extrapolation was rejected.
+    """
+    n = len(components)
+    extrapolated = [P + step * (C - P)
+                    for C, P in zip(components[:-1], previous[:-1])]
+    for idx, res in enumerate(extrapolated):
+        tree.update(idx, res)
+    extrapolated_grams = [np.dot(arr.T, arr) for arr in extrapolated]
+    M = tree.mttkrp(n - 1)
+    res = _solve_gram(M, reduce(np.multiply, extrapolated_grams, 1.),
+                      solver, ridge, info)
+    extrapolated_fit = X_sq - np.sum(M * res)
+    if extrapolated_fit >= fit:
+        for idx, res in enumerate(components[:-1]):
+            tree.update(idx, res)
+        return None
+    normalization = res.max(axis=0)
+    normalization[normalization < 1] = 1
+    res /= normalization
+    components[:] = extrapolated + [res]
+    grams[:] = extrapolated_grams + [np.dot(res.T, res)]
+    tree.update(n - 1, res)
+    err = _cp_error(X, X_sq, components, grams, M)
+    return extrapolated_fit, err
+
+
+def _balance(components):
+    """
+    Rescale the columns of every factor to equal norms across modes, in
+    place, without changing the CP model.
+    """
+    norms = np.array([np.sqrt((U ** 2).sum(axis=0)) for U in components])
+    norms[norms == 0] = 1.
+    target = np.exp(np.log(norms).mean(axis=0))
+    for U, norm in zip(components, norms):
+        U *= target / norm
+
+
+def _gn_product(components, grams, V):
+    """
+    Product of the Gauss-Newton matrix J^T J of a CP model with V.
+
+    J is the Jacobian of the model with respect to all factors, and V holds
+    one matrix per factor. Block (n, m) of J^T J only involves Hadamard
+    products of the Gram matrices of the factors, so the product costs
+    O(sum(d) * R ** 2) and J is never formed.
+    """
+    n_modes = len(components)
+    cross = [np.dot(v.T, U) for U, v in zip(components, V)]
+    res = []
+    for n in range(n_modes):
+        out = np.dot(V[n], reduce(np.multiply, [grams[m] for m in
+                                                range(n_modes) if m != n],
+                                  1.))
+        for m in range(n_modes):
+            if m != n:
+                G = reduce(np.multiply, [grams[k] for k in range(n_modes)
+                                         if k != n and k != m], 1.)
+                out += np.dot(components[n], G * cross[m])
+        res.append(out)
+    return res
+
+
+def _pcg(apply_A, b, apply_P, max_iter, tol):
+    """
+    Preconditioned conjugate gradients for A x = b, where vectors are lists
+    of matrices. Returns x and the number of iterations.
+    """
+    def dot(U, V):
+        return sum(np.sum(u * v) for u, v in zip(U, V))
+
+    x = [np.zeros_like(v) for v in b]
+    r = [v.copy() for v in b]
+    z = apply_P(r)
+    p = [v.copy() for v in z]
+    rz = dot(r, z)
+    b_norm = np.sqrt(dot(b, b))
+    for itr in range(max_iter):
+        Ap = apply_A(p)
+        alpha = rz / dot(p, Ap)
+        x = [u + alpha * v for u, v in zip(x, p)]
+        r = [u - alpha * v for u, v in zip(r, Ap)]
+        if np.sqrt(dot(r, r)) <= tol * b_norm:
+            break
+        z = apply_P(r)
+        rz_new = dot(r, z)
+        p = [u + rz_new / rz * v for u, v in zip(z, p)]
+        rz = rz_new
+    return x, itr + 1
+
+
+def _cp_lm(X, n_components, tol, max_iter, init_type, random_state=None,
+           cache_bytes=0, csf="per_mode", n_jobs=1, callback=None,
+           max_cg_iter=15, cg_tol=1E-6):
+    """
+    CANDECOMP/PARAFAC decomposition by damped Gauss-Newton
+    (Levenberg-Marquardt).
+
+    Each step solves (J^T J + damping * I) p = -g with conjugate gradients,
+    using ``_gn_product`` for J^T J and the block Jacobi preconditioner
+    (G_n + damping * I)^-1 of every factor, where G_n is the Hadamard
+    product of the other Gram matrices. The damping follows the gain ratio
+    of each step (Nielsen, 1999).
+    """
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    else:
+        unfoldings = UnfoldingCache(X, cache_bytes)
+    components = _initialize(X, n_components, init_type, random_state,
+                             unfoldings)
+    n_modes = len(components)
+    tree = _mttkrp_engine(X, components, csf, n_jobs)
+    X_sq = _sq_norm(X)
+    info = {"n_fallbacks": 0, "history": [], "times": [],
+            "cg_iterations": []}
+    t0 = time.time()
+
+    # start from the best scaling of the initial model
+    grams = [np.dot(U.T, U) for U in components]
+    inner = np.sum(tree.mttkrp(n_modes - 1) * components[-1])
+    components[-1] = components[-1] * (inner /
+                                       np.sum(reduce(np.multiply, grams)))
+
+    def gradient():
+        _balance(components)
+        grams[:] = [np.dot(U.T, U) for U in components]
+        for idx, U in enumerate(components):
+            tree.update(idx, U)
+        M = [tree.mttkrp(idx) for idx in range(n_modes)]
+        g = [np.dot(U, reduce(np.multiply, [grams[m] for m in range(n_modes)
+                                            if m != idx], 1.)) - M[idx]
+             for idx, U in enumerate(components)]
+        return g, _cp_error(X, X_sq, components, grams, M[-1])
+
+    g, err = gradient()
+    damping = 1E-3 * max(np.max(np.diag(reduce(
+        np.multiply, [grams[m] for m in range(n_modes) if m != n], 1.)))
+        for n in range(n_modes))
+    nu = 2.
+
+    for itr in range(max_iter):
+        def apply_A(V):
+            return [u + damping * v for u, v in
+                    zip(_gn_product(components, grams, V), V)]
+
+        def apply_P(V):
+            return [_solve_gram(v, reduce(np.multiply, [
+                grams[m] for m in range(n_modes) if m != idx], 1.),
+                "cholesky", damping, info) for idx, v in enumerate(V)]
+
+        step, n_cg = _pcg(apply_A, [-v for v in g], apply_P, max_cg_iter,
+                          cg_tol)
+        info["cg_iterations"].append(n_cg)
+        # decrease of 1/2 ||X - model||^2 predicted by the linear model
+        JtJ_step = _gn_product(components, grams, step)
+        predicted = -sum(np.sum(s * (v + .5 * w))
+                         for s, v, w in zip(step, g, JtJ_step))
+
+        trial = [U + s for U, s in zip(components, step)]
+        trial_grams = [np.dot(U.T, U) for U in trial]
+        for idx, U in enumerate(trial):
+            tree.update(idx, U)
+        err_new = _cp_error(X, X_sq, trial, trial_grams,
+                            tree.mttkrp(n_modes - 1))
+        rho = .5 * (err - err_new) / predicted if predicted > 0 else -1.
+        if rho > 0:
+            err_old = err
+            components[:] = trial
+            g, err = gradient()
+            damping *= max(1. / 3, 1. - (2. * rho - 1.) ** 3)
+            nu = 2.
+            thresh = np.abs(err - err_old) / err_old
+        else:
+            for idx, U in enumerate(components):
+                tree.update(idx, U)
+            damping *= nu
+            nu *= 2.
+            thresh = np.inf
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
+        if thresh < tol:
+            break
+        if not np.isfinite(damping) or damping > 1E16 * X_sq:
+            # no step decreases the error any more
+            break
+        if callback is not None and callback(itr, err, thresh):
+            info["stopped_early"] = True
+            break
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    info["damping"] = damping
+    info["cache_nbytes"] = tree.nbytes
+    if isinstance(X, SlabTensor):
+        info["chunk_throughput"] = X.throughput
+    elif isinstance(unfoldings, UnfoldingCache):
+        info["unfold_cache_nbytes"] = unfoldings.nbytes
+    if isinstance(getattr(tree, "X", None), SlabTensor):
+        _slab_info(info, tree.X, lambda: tree.X.mttkrp(components, 0))
+        tree.X.close()
+    return components, info
+
+
+# Number of entries of X sampled to estimate the error of randomized CP. As
+# the sampled updates make single iterations noisy, convergence is checked
+# once per epoch of _RANDOMIZED_EPOCH iterations on the mean estimate of the
+# epoch, and the decomposition stops after _RANDOMIZED_PATIENCE consecutive
+# epochs without an improvement of tol. Every such epoch doubles the number
+# of sampled rows, up to _RANDOMIZED_MAX_GROWTH times the initial one.
+_ERROR_SAMPLES = 2 ** 14
+_RANDOMIZED_EPOCH = 10
+_RANDOMIZED_PATIENCE = 3
+_RANDOMIZED_MAX_GROWTH = 8
+
+
+def _default_n_samples(n_components):
+    """Number of sampled Khatri-Rao rows per mode update, 10 R log R."""
+    return int(np.ceil(10 * n_components * max(np.log(n_components), 1.)))
+
+
+def _cp_randomized(X, n_components, tol, max_iter, init_type,
+                   random_state=None, solver="cholesky", ridge=0.,
+                   cache_bytes=0, n_samples=None, callback=None):
+    """
+    Randomized CANDECOMP/PARAFAC decomposition (CPRAND).
+
+    Every mode update solves its least squares problem on ``n_samples``
+    uniformly sampled rows of the Khatri-Rao product and the matching fibers
+    of X, and the error is estimated on a fixed sample of entries of X, so
+    the cost of an iteration does not depend on the size of X (Battaglino,
+    Ballard & Kolda, 2018). Convergence is checked once per epoch of
+    iterations, and the factors with the lowest estimated error are returned.
+    """
+    if isinstance(X, COOTensor):
+        raise ValueError("The randomized algorithm is not supported for "
+                         "sparse tensors")
+    rs = check_random_state(random_state)
+    if isinstance(X, SlabTensor):
+        unfoldings = X
+        T = X.X
+    else:
+        unfoldings = UnfoldingCache(X, cache_bytes)
+        T = X
+    shape = X.shape
+    n_modes = len(shape)
+    if n_samples is None:
+        n_samples = _default_n_samples(n_components)
+    components = _initialize(X, n_components, init_type, rs, unfoldings)
+    # fibers along each mode, sampled by indexing the other modes
+    fibers = [np.moveaxis(T, n, -1) for n in range(n_modes)]
+
+    size = int(np.prod(shape))
+    n_err = min(size, _ERROR_SAMPLES)
+    if n_err == size:
+        err_idx = np.unravel_index(np.arange(size), shape)
+    else:
+        err_idx = tuple(rs.randint(d, size=n_err) for d in shape)
+    X_err = np.asarray(T[err_idx], dtype=np.float64)
+
+    max_samples = _RANDOMIZED_MAX_GROWTH * n_samples
+    best_err = np.inf
+    epoch_err = np.inf
+    best = components
+    n_stalled = 0
+    info = {"n_fallbacks": 0, "history": [],
+            "times": []}
+    t0 = time.time()
+
+    for itr in range(max_iter):
+        for n in range(n_modes):
+            others = [m for m in range(n_modes) if m != n]
+            idx = [rs.randint(shape[m], size=n_samples) for m in others]
+            Z = reduce(np.multiply, [components[m][i]
+                                     for m, i in zip(others, idx)])
+            F = np.asarray(fibers[n][tuple(idx)], dtype=np.float64)
+            components[n] = _solve_gram(np.dot(F.T, Z), np.dot(Z.T, Z),
+                                        solver, ridge, info)
+        _balance(components)
+
+        model = reduce(np.multiply, [components[n][err_idx[n]]
+                                     for n in range(n_modes)]).sum(axis=1)
+        err = np.sum((X_err - model) ** 2) * size / n_err
+        if err < best_err:
+            best_err = err
+            best = [c.copy() for c in components]
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
+        # relative improvement of the mean estimate over the last epoch
+        mean_err = np.mean(info["history"][-_RANDOMIZED_EPOCH:])
+        if epoch_err == np.inf:
+            thresh = np.inf
+        else:
+            thresh = (epoch_err - mean_err) / epoch_err
+        if (itr + 1) % _RANDOMIZED_EPOCH == 0:
+            if thresh < tol:
+                # more samples lower the noise that holds the sampled
+                # updates back, e.g. in a swamp
+                n_stalled += 1
+                n_samples = min(2 * n_samples, max_samples)
+            else:
+                n_stalled = 0
+            epoch_err = min(epoch_err, mean_err)
+            if n_stalled >= _RANDOMIZED_PATIENCE:
+                break
+        if callback is not None and callback(itr, err, thresh):
+            info["stopped_early"] = True
+            break
+    info["n_iter"] = itr + 1
+    info["n_samples"] = n_samples
+    info["err"] = best_err
+    return best, info
+
+
+def _hals_update(U, M, G, eps):
+    """
+    Update the columns of U in turn by nonnegative least squares, in place,
+    given the MTTKRP M and Hadamard product G of the other Gram matrices.
+    """
+    for r in range(U.shape[1]):
+        if G[r, r] > 0:
+            U[:, r] += (M[:, r] - np.dot(U, G[:, r])) / G[r, r]
+        np.maximum(U[:, r], eps, out=U[:, r])
+    return U
+
+
+def _mu_update(U, M, G, eps):
+    """Multiplicative update of U, in place (Lee & Seung, 2001)."""
+    U *= np.maximum(M, 0.) / np.maximum(np.dot(U, G), eps)
+    np.maximum(U, eps, out=U)
+    return U
+
+
+_NONNEGATIVE_UPDATES = {"hals": _hals_update, "mu": _mu_update}
+
+
+def _cp_nonnegative(X, n_components, tol, max_iter, init_type,
+                    random_state=None, cache_bytes=0, csf="per_mode",
+                    n_jobs=1, callback=None, update="hals"):
+    """
+    Nonnegative CANDECOMP/PARAFAC decomposition.
+
+    Every mode is updated from its MTTKRP and the Hadamard product of the
+    other Gram matrices, either column by column in closed form by
+    hierarchical ALS (Cichocki & Phan, 2009) or by multiplicative updates.
+    """
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    else:
+        unfoldings = UnfoldingCache(X, cache_bytes)
+    components = [np.abs(U) for U in _initialize(X, n_components, init_type,
+                                                   random_state, unfoldings)]
+    n_modes = len(components)
+    tree = _mttkrp_engine(X, components, csf, n_jobs)
+    X_sq = _sq_norm(X)
+    eps = np.finfo(float).eps
+    update_mode = _NONNEGATIVE_UPDATES[update]
+
+    # start from the best scaling of the initial model
+    grams = [np.dot(U.T, U) for U in components]
+    inner = np.sum(tree.mttkrp(n_modes - 1) * components[-1])
+    components[-1] *= max(inner, eps) / np.sum(reduce(np.multiply, grams))
+    grams[-1] = np.dot(components[-1].T, components[-1])
+    tree.update(n_modes - 1, components[-1])
+
+    err = 1E10
+    info = {"update": update, "history": [], "times": []}
+    t0 = time.time()
+
+    for itr in range(max_iter):
+        err_old = err
+
+        for idx in range(n_modes):
+            M = tree.mttkrp(idx)
+            G = reduce(np.multiply, [grams[n] for n in range(n_modes)
+                                     if n != idx], 1.)
+            components[idx] = update_mode(components[idx], M, G, eps)
+            grams[idx] = np.dot(components[idx].T, components[idx])
+            tree.update(idx, components[idx])
+
+        err = _cp_error(X, X_sq, components, grams, M)
+        _balance(components)
+        grams = [np.dot(U.T, U) for U in components]
+        for idx, U in enumerate(components):
+            tree.update(idx, U)
+
         thresh = np.abs(err - err_old) / err_old
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
         if thresh < tol:
             break
-    return components
+        if callback is not None and callback(itr, err, thresh):
+            info["stopped_early"] = True
+            break
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    info["cache_nbytes"] = tree.nbytes
+    _close_slabs(getattr(tree, "X", None))
+    return components, info
+
+
+# Largest fraction of missing entries for which CP with missing data fills
+# them in by EM, beyond which it solves weighted least squares problems
+_EM_MAX_MISSING = .3
+
+
+def _cp_reconstruct(components):
+    """Dense tensor of a CP model."""
+    shape = [U.shape[0] for U in components]
+    return unmatricize(np.dot(components[0],
+                              kr_many(components[1:][::-1]).T), 0, shape)
+
+
+def _cp_missing(X, mask, n_components, tol, max_iter, init_type,
+                random_state=None, solver="cholesky", ridge=0.,
+                cache_bytes=0, callback=None):
+    """
+    CANDECOMP/PARAFAC decomposition fitting only the entries where mask is
+    True (Tomasi & Bro, 2005).
+
+    Up to ``_EM_MAX_MISSING`` missing entries, every ALS sweep runs on X
+    with its missing entries filled in by the current model. Beyond that,
+    every row of a factor solves its own normal equations, weighted by the
+    mask. Their right hand sides are the MTTKRP of the masked X, and their
+    Gram matrices the MTTKRP of the mask with the row-wise outer products
+    of the factors, so all rows are solved at once as a batch.
+    """
+    W = mask.astype(np.float64)
+    X0 = np.where(mask, X, 0.)
+    missing_rate = 1. - W.mean()
+    n_modes = X.ndim
+    # initialize on X filled in with the mean of the observed entries
+    X_filled = np.where(mask, X0, X0.sum() / W.sum())
+    components = _initialize(X_filled, n_components, init_type, random_state,
+                             UnfoldingCache(X_filled, cache_bytes))
+    err = 1E10
+    info = {"n_fallbacks": 0, "missing_rate": missing_rate, "history": [],
+            "times": []}
+    t0 = time.time()
+
+    if missing_rate <= _EM_MAX_MISSING:
+        info["missing_strategy"] = "em"
+    else:
+        info["missing_strategy"] = "weighted"
+        n_components = components[0].shape[1]
+        diag = np.arange(n_components)
+
+        def outer_rows(U):
+            return (U[:, :, None] * U[:, None, :]).reshape(len(U), -1)
+
+        rhs_tree = DimensionTree(X0, components)
+        gram_tree = DimensionTree(W, [outer_rows(U) for U in components])
+
+    for itr in range(max_iter):
+        err_old = err
+
+        if info["missing_strategy"] == "em":
+            grams = [np.dot(U.T, U) for U in components]
+            normalization = _als_sweep(components, grams,
+                                       DimensionTree(X_filled, components),
+                                       itr, solver, ridge, info)
+            components[-1] *= normalization
+        else:
+            for idx in range(n_modes):
+                A = gram_tree.mttkrp(idx).reshape(-1, n_components,
+                                                  n_components)
+                # a trace-relative jitter keeps rows without observed
+                # entries solvable
+                A[:, diag, diag] += ridge + 1E-12 * max(
+                    A[:, diag, diag].sum(axis=1).max(), 1.)
+                res = np.linalg.solve(A, rhs_tree.mttkrp(idx)[:, :, None])
+                components[idx] = res[:, :, 0]
+                rhs_tree.update(idx, components[idx])
+                gram_tree.update(idx, outer_rows(components[idx]))
+        _balance(components)
+        if info["missing_strategy"] == "weighted":
+            for idx, U in enumerate(components):
+                rhs_tree.update(idx, U)
+                gram_tree.update(idx, outer_rows(U))
+
+        model = _cp_reconstruct(components)
+        err = np.sum(W * (X0 - model) ** 2)
+        if info["missing_strategy"] == "em":
+            X_filled = np.where(mask, X0, model)
+
+        thresh = np.abs(err - err_old) / err_old
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
+        if thresh < tol:
+            break
+        if callback is not None and callback(itr, err, thresh):
+            info["stopped_early"] = True
+            break
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    return components, info
+
+
+def _default_sketch_size(n_components):
+    """Smallest power of two of at least 100 R rows for R components."""
+    return int(2 ** np.ceil(np.log2(100 * n_components)))
+
+
+def _cp_tensorsketch(X, n_components, tol, max_iter, init_type,
+                     random_state=None, solver="cholesky", ridge=0.,
+                     cache_bytes=0, sketch_size=None, callback=None):
+    """
+    CANDECOMP/PARAFAC decomposition by ALS on TensorSketched least squares
+    problems (Wang, Tung, Smola & Anandkumar, 2015).
+
+    The unfoldings of X are sketched once, in a single pass over X, after
+    which every mode update only involves the sketches, of ``sketch_size``
+    rows, so the cost of an iteration does not depend on the size of X. The
+    error is the residual of the sketched problem of the last mode.
+    """
+    rs = check_random_state(random_state)
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    else:
+        unfoldings = UnfoldingCache(X, cache_bytes)
+    if sketch_size is None:
+        sketch_size = _default_sketch_size(n_components)
+    components = _initialize(X, n_components, init_type, rs, unfoldings)
+    sketch = TensorSketch(X.shape, sketch_size, rs)
+    t0 = time.time()
+    Y = sketch.sketch_unfoldings(X)
+    Y_sq = np.sum(Y[-1] ** 2)
+    err = 1E10
+    info = {"n_fallbacks": 0, "sketch_size": sketch_size,
+            "sketch_time": time.time() - t0, "history": [], "times": []}
+
+    for itr in range(max_iter):
+        err_old = err
+
+        for n in range(len(components)):
+            Z = sketch.sketch_kr(components, n)
+            M, G = np.dot(Y[n].T, Z), np.dot(Z.T, Z)
+            components[n] = _solve_gram(M, G, solver, ridge, info)
+        # ||Y - Z C^T||^2 from the terms of the last solve
+        C = components[-1]
+        err = Y_sq - 2 * np.sum(M * C) + np.sum(G * np.dot(C.T, C))
+        _balance(components)
+
+        thresh = np.abs(err - err_old) / err_old
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
+        if thresh < tol:
+            break
+        if callback is not None and callback(itr, err, thresh):
+            info["stopped_early"] = True
+            break
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    return components, info
+
+
+def _check_mask(X, mask=None):
+    """
+    Boolean mask of the observed entries of X, combining the given mask with
+    the NaN entries of an in-memory X, or None if every entry is observed.
+    """
+    in_memory = isinstance(X, np.ndarray) and not isinstance(X, np.memmap)
+    if mask is None and not in_memory:
+        return None
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if not in_memory:
+            raise ValueError("mask is only supported for in-memory ndarrays")
+        if mask.shape != X.shape:
+            raise ValueError("mask of shape %s does not match X of shape %s"
+                             % (mask.shape, X.shape))
+    if np.issubdtype(X.dtype, np.floating):
+        observed = ~np.isnan(X)
+        mask = observed if mask is None else mask & observed
+    if mask is None or mask.all():
+        return None
+    if not mask.any():
+        raise ValueError("X has no observed entries")
+    return mask
+
+
+def _check_nonnegative(X):
+    """
+    Raise a ValueError if X has negative entries, reading slabbed inputs in
+    a single pass and only the stored entries of sparse ones.
+    """
+    if isinstance(X, SlabTensor):
+        x_min = min(res for _, _, res in
+                    X.map(lambda start, stop, slab: slab.min()))
+    elif isinstance(X, COOTensor):
+        x_min = X.data.min() if X.data.size else 0.
+    else:
+        x_min = X.min()
+    if x_min < 0:
+        raise ValueError("X must be nonnegative, got a minimum of %r"
+                         % x_min)
+
+
+def _check_out_of_core(X, chunk_size=None, n_jobs=1):
+    """Wrap memory mapped inputs, or any input if chunk_size is given."""
+    if isinstance(X, COOTensor):
+        return X
+    if isinstance(X, SlabTensor):
+        if chunk_size is not None or n_jobs != 1:
+            X = SlabTensor(X.X, X.chunk_size if chunk_size is None
+                           else chunk_size, n_jobs)
+    elif chunk_size is not None:
+        X = SlabTensor(X, chunk_size, n_jobs)
+    elif isinstance(X, np.memmap):
+        X = SlabTensor(X, n_jobs=n_jobs)
+    return X
 
 
 def cp(X, n_components=None, tol=1E-4, max_iter=500, init_type="hosvd",
-       random_state=None):
+       random_state=None, solver="cholesky", ridge=0., cache_bytes=0,
+       chunk_size=None, csf="per_mode", n_init=1, n_jobs=1,
+       line_search=None, algorithm="als", n_samples=None, sketch_size=None,
+       nonnegative=False, mask=None, return_info=False):
     """
     CANDECOMP/PARAFAC decomposition using an alternating least squares
     algorithm.
 
     Parameters
     ----------
-    X : ndarray
-        Input data to decompose
+    X : ndarray, np.memmap, SlabTensor or COOTensor
+        Input data to decompose. Memory mapped and SlabTensor inputs are
+        streamed slab by slab along their first mode. Sparse COOTensor inputs
+        are decomposed without densifying them, at a cost proportional to
+        their number of stored entries. NaN entries of an in-memory ndarray
+        are treated as missing.
 
     n_components : int
         The number of components in the decomposition. Note that unlike PCA or
@@ -144,12 +1311,119 @@ def cp(X, n_components=None, tol=1E-4, max_iter=500, init_type="hosvd",
         Maximum number of iterations to perform before exiting.
 
     init_type : string, optional (default="hosvd")
-        How to initialize the decomposition. Choices are "random" or "hosvd",
-        where "random" is initialized with uniform random values, and "hosvd" is
-        initialized by the high order SVD of the dataset.
+        How to initialize the decomposition. Choices are "random", "hosvd",
+        "st_hosvd" or "randomized_hosvd", where "random" is initialized with
+        uniform random values, "hosvd" is initialized by the high order SVD of
+        the dataset, "st_hosvd" by its sequentially truncated variant and
+        "randomized_hosvd" by randomized SVDs of the unfoldings, which avoids
+        the eigendecomposition of large Gram matrices. For sparse X, "hosvd"
+        uses Lanczos iterations on the sparse unfoldings, and "st_hosvd" is
+        not supported.
 
     random_state : int, None, or np.RandomState instance
-       Random seed information to use when ``init_type`` == "random"
+       Random seed information to use when ``init_type`` is "random" or
+       "randomized_hosvd"
+
+    solver : string, optional (default="cholesky")
+        How to solve the normal equations of each mode update. Choices are
+        "cholesky", "eigh" or "pinv". When the Gram product is too
+        ill-conditioned for "cholesky", the "eigh" path is used instead.
+
+    ridge : float, optional (default=0.)
+        Tikhonov regularization added to the diagonal of the Gram product of
+        every mode update.
+
+    cache_bytes : int or None, optional (default=0)
+        Memory budget in bytes for the unfoldings of X cached during the
+        decomposition. The iterations never read the unfoldings, so by
+        default none are kept beyond their use in the initialization. None
+        caches the unfolding of every mode.
+
+    chunk_size : int or None, optional (default=None)
+        Maximum number of bytes of X loaded at once when X is streamed. If
+        given, X is streamed even when it is an in-memory ndarray.
+
+    csf : string or None, optional (default="per_mode")
+        Compressed sparse fiber storage used for the MTTKRPs of a sparse X,
+        built the first time each mode is needed and reused afterwards.
+        "per_mode" keeps one tree rooted at each mode for speed, "single"
+        keeps one tree for all modes to save memory and None works directly
+        on the coordinates.
+
+    n_init : int, optional (default=1)
+        Number of starting points. The first uses ``init_type`` and the
+        others random starts, unless ``init_type`` is "randomized_hosvd".
+        The decomposition with the lowest least squares residual is
+        returned. Restarts that have nearly converged to a residual clearly
+        above the current residual of another restart are stopped early.
+        Not supported by the "randomized" and "tensorsketch" algorithms,
+        whose estimated errors are not comparable across restarts.
+
+    n_jobs : int, optional (default=1)
+        Number of threads computing the MTTKRPs, each on a slab of X along
+        its first mode. -1 uses all cores. BLAS threads are capped while the
+        workers run so that the cores are not oversubscribed, which needs
+        the optional threadpoolctl package. Sparse inputs are always
+        processed by a single thread. If ``n_init`` > 1, the
+        threads run whole restarts instead, all sharing X.
+
+    line_search : int or None, optional (default=None)
+        If given, every ``line_search`` iterations the factors are
+        extrapolated along their last update, with the last mode solved for,
+        and the extrapolation is kept if it lowers the least squares error.
+        This shortens the long stretches of slow progress ("swamps") of ALS.
+        Only supported by the "als" algorithm.
+
+    algorithm : string, optional (default="als")
+        Optimization algorithm. "als" is plain alternating least squares.
+        "accelerated_als" extrapolates the factors with Nesterov momentum
+        before every sweep, and restarts the momentum from a plain sweep
+        whenever the least squares error increases. "lm" updates all
+        factors at once by damped Gauss-Newton (Levenberg-Marquardt) steps,
+        which converges in far fewer iterations on ill-conditioned problems.
+        Its Gauss-Newton systems are solved by preconditioned conjugate
+        gradients from the Gram matrices of the factors, without forming
+        the Jacobian. ``solver`` and ``ridge`` do not apply to "lm", whose
+        factors are returned with the scale of the model spread evenly
+        across modes instead of normalized. "randomized" solves every mode
+        update on ``n_samples`` sampled rows of the Khatri-Rao product and
+        the matching fibers of X, and estimates the error from sampled
+        entries, so that an iteration costs the same however large X is.
+        Its factors are returned like those of "lm". It is not supported
+        for sparse X. "tensorsketch" sketches the unfoldings of X once, in a
+        single pass, and then solves every mode update on TensorSketches of
+        ``sketch_size`` rows of the Khatri-Rao product and the unfolding,
+        combined by FFT. Its factors are also returned like those of "lm".
+
+    n_samples : int or None, optional (default=None)
+        Number of Khatri-Rao rows sampled per mode update by the
+        "randomized" algorithm, doubled after every epoch of iterations
+        without improvement. None uses 10 R log R for R components.
+
+    sketch_size : int or None, optional (default=None)
+        Number of rows of the sketches of the "tensorsketch" algorithm.
+        Larger sketches are more accurate and slower. None uses the smallest
+        power of two of at least 100 R for R components.
+
+    nonnegative : bool or string, optional (default=False)
+        Whether to constrain all factors to be nonnegative. True or "hals"
+        updates the factors column by column in closed form by hierarchical
+        ALS, and "mu" by multiplicative updates, which needs a nonnegative
+        X. Both reuse the MTTKRP and Gram matrices of ALS. Nonnegative
+        factors are returned like those of the "lm" algorithm, which must
+        be "als" for them.
+
+    mask : array-like of bool or None, optional (default=None)
+        Entries of X that are observed, with the same shape as X. Only the
+        observed entries, which also exclude any NaN entries, are fitted.
+        With up to 30% of the entries missing, they are filled in by the
+        current model before every ALS sweep (EM). Beyond that, each factor
+        row solves its own weighted least squares problem, all rows at once
+        as a batch. Only supported for in-memory ndarrays and the "als"
+        algorithm. Factors are returned like those of the "lm" algorithm.
+
+    return_info : bool, optional (default=False)
+        Whether to also return a dictionary of metadata about the run.
 
 
     Returns
@@ -158,6 +1432,41 @@ def cp(X, n_components=None, tol=1E-4, max_iter=500, init_type="hosvd",
         Basis functions for X, each of shape [X.shape[idx], n_components] where
         idx is the index into ``components``.
 
+    info : dict
+        Only returned if ``return_info`` is True. Contains the "solver" and
+        "ridge" used, the number of solver fallbacks "n_fallbacks", the number
+        of iterations "n_iter", the final squared reconstruction error "err",
+        the bytes held by cached partial contractions or CSF trees
+        "cache_nbytes" and by cached unfoldings "unfold_cache_nbytes". The
+        error and the elapsed seconds after every iteration are given in
+        "history" and "times", and the iterations whose line search was kept in
+        "line_search_accepted". The "als" and "accelerated_als" algorithms give
+        the least squares residual of the last sweep in "fit", which unlike
+        "err" accounts for the scale dropped by normalizing the factors. The
+        "accelerated_als" algorithm also gives the number of momentum restarts
+        "n_restarts". The "lm" algorithm gives the conjugate gradient
+        iterations of every step in "cg_iterations" and the final "damping",
+        and its "err" is the squared residual of the returned factors. The
+        "randomized" algorithm gives the "n_samples" of its last epoch, and
+        its "err" is estimated from sampled entries of X. The "tensorsketch"
+        algorithm gives the "sketch_size" used and the seconds spent
+        sketching X "sketch_time", and its "err" is the residual of the
+        sketched problem. Nonnegative
+        decompositions give the "update" used. With missing entries, the
+        fraction missing is given in "missing_rate" and the strategy used, "em"
+        or "weighted", in "missing_strategy", and "err" is the squared residual
+        over the observed entries. When X is streamed, the bytes per second
+        processed for each slab of the last pass over X are given in
+        "chunk_throughput" instead of "unfold_cache_nbytes". When X is streamed
+        or ``n_jobs`` > 1, the mean elapsed seconds of a pass over the slabs of
+        X are given in "pass_time", and with ``n_jobs`` > 1 the speedup of one
+        extra MTTKRP pass on the threads over the same pass on one thread in
+        "parallel_speedup". If ``n_init`` > 1, the metadata is that of
+        the restart with the lowest "fit" (or "err" for the algorithms without
+        one), whose index is "best_run", and "runs" lists the "init_type",
+        "random_state", "n_iter", "err", "fit", "time" and "stopped_early" of
+        every restart.
+
 
     References
     ----------
@@ -174,9 +1483,116 @@ def cp(X, n_components=None, tol=1E-4, max_iter=500, init_type="hosvd",
     if n_components is None:
         raise ValueError("n_components is a required argument!")
 
+    if solver not in _GRAM_SOLVERS:
+        raise ValueError("solver must be one of %s, got %r"
+                         % (sorted(_GRAM_SOLVERS.keys()), solver))
+
+    if n_init < 1:
+        raise ValueError("n_init must be at least 1, got %r" % n_init)
+
+    if algorithm not in ("als", "accelerated_als", "lm", "randomized",
+                         "tensorsketch"):
+        raise ValueError("algorithm must be one of 'als', 'accelerated_als', "
+                         "'lm', 'randomized' or 'tensorsketch', got %r"
+                         % algorithm)
+
+    if n_init > 1 and algorithm in ("randomized", "tensorsketch"):
+        # each restart estimates its error from its own samples or sketches
+        raise ValueError("n_init > 1 is not supported by the %r algorithm"
+                         % algorithm)
+
+    if n_samples is not None and n_samples < 1:
+        raise ValueError("n_samples must be None or at least 1, got %r"
+                         % n_samples)
+
+    if sketch_size is not None and sketch_size < 1:
+        raise ValueError("sketch_size must be None or at least 1, got %r"
+                         % sketch_size)
+
+    if line_search is not None and line_search < 1:
+        raise ValueError("line_search must be None or at least 1, got %r"
+                         % line_search)
+
+    if line_search is not None and algorithm != "als":
+        raise ValueError("line_search is only supported by the 'als' "
+                         "algorithm")
+
+    if nonnegative not in (False, True, "hals", "mu"):
+        raise ValueError("nonnegative must be a bool, 'hals' or 'mu', got %r"
+                         % (nonnegative,))
+
+    if nonnegative and (algorithm != "als" or line_search is not None):
+        raise ValueError("nonnegative is only supported by the 'als' "
+                         "algorithm without line_search")
+
     check_tensor(X)
-    return _cpN(X, n_components, tol=tol, max_iter=max_iter,
-                init_type=init_type, random_state=random_state)
+    mask = _check_mask(X, mask)
+    if mask is not None and (algorithm != "als" or nonnegative or
+                             line_search is not None or
+                             chunk_size is not None):
+        raise ValueError("Missing entries are only supported by the 'als' "
+                         "algorithm, without line_search, nonnegative or "
+                         "chunk_size")
+    if nonnegative == "mu":
+        _check_nonnegative(X)
+    if n_init > 1:
+        X = _check_out_of_core(X, chunk_size)
+        components, info = _cp_multi_start(
+            X, n_components, n_init, n_jobs, tol=tol, max_iter=max_iter,
+            init_type=init_type, random_state=random_state, solver=solver,
+            ridge=ridge, cache_bytes=cache_bytes, csf=csf,
+            line_search=line_search, algorithm=algorithm,
+            n_samples=n_samples, sketch_size=sketch_size,
+            nonnegative=nonnegative, mask=mask)
+    else:
+        X = _check_out_of_core(X, chunk_size, n_jobs)
+        try:
+            components, info = _cpN(
+                X, n_components, tol=tol, max_iter=max_iter,
+                init_type=init_type, random_state=random_state,
+                solver=solver, ridge=ridge, cache_bytes=cache_bytes, csf=csf,
+                n_jobs=n_jobs, line_search=line_search, algorithm=algorithm,
+                n_samples=n_samples, sketch_size=sketch_size,
+                nonnegative=nonnegative, mask=mask)
+        finally:
+            _close_slabs(X)
+    if return_info:
+        return components, info
+    return components
+
+
+def _project(X, components, skip=None):
+    """
+    Multiply X by the transpose of every factor except ``components[skip]``.
+
+    For sparse X the full projection goes through the projection on every
+    mode but the last, so memory stays proportional to nnz * R^(N-1).
+    """
+    if skip is None and isinstance(X, COOTensor):
+        last = X.ndim - 1
+        return tmult(_project(X, components, skip=last), components[last].T,
+                     last)
+    axes = [n for n in range(X.ndim) if n != skip]
+    matrices = [components[n].T for n in axes]
+    if isinstance(X, (SlabTensor, COOTensor)):
+        return X.multi_tmult(matrices, axes)
+    return multi_tmult(X, matrices, axes)
+
+
+def _leading_subspace(Y, n_components):
+    """
+    Leading left singular vectors of a matrix with few columns or few rows.
+
+    Uses the eigendecomposition of the smaller Gram matrix when Y is wide and
+    a thin SVD when Y is tall, so the cost is cubic only in the smaller side.
+    """
+    if Y.shape[0] <= Y.shape[1]:
+        _, U = linalg.eigh(Y.dot(Y.T))
+        U = U[:, ::-1][:, :n_components]
+    else:
+        U, _, _ = linalg.svd(Y, full_matrices=False)
+        U = U[:, :n_components]
+    return sign_flip(U)
 
 
 def _tucker3(X, n_components, tol, max_iter, init_type, random_state=None):
@@ -190,81 +1606,185 @@ def _tucker3(X, n_components, tol, max_iter, init_type, random_state=None):
     if len(X.shape) != 3:
         raise ValueError("Tucker3 decomposition only supports 3 dimensions!")
 
-    if init_type == "random":
-        A, B, C = _random_init(X, n_components, random_state)
-    elif init_type == "hosvd":
-        A, B, C = _hosvd_init(X, n_components)
+    A, B, C = _initialize(X, n_components, init_type, random_state)
     err = 1E10
     X_sq = np.sum(X ** 2)
 
     for itr in range(max_iter):
         err_old = err
-        U, S, V = linalg.svd(matricize(X, 0).dot(np.kron(C, B)),
-                             full_matrices=False)
-        A = U[:, :n_components]
-        U, S, V = linalg.svd(matricize(X, 1).dot(np.kron(C, A)),
-                             full_matrices=False)
-        B = U[:, :n_components]
-        U, S, V = linalg.svd(matricize(X, 2).dot(np.kron(B, A)),
-                             full_matrices=False)
-        C = U[:, :n_components]
+        A = _leading_subspace(
+            matricize(tmult(tmult(X, B.T, 1), C.T, 2), 0), n_components)
+        B = _leading_subspace(
+            matricize(tmult(tmult(X, A.T, 0), C.T, 2), 1), n_components)
+        C = _leading_subspace(
+            matricize(tmult(tmult(X, A.T, 0), B.T, 1), 2), n_components)
         G = tmult(tmult(tmult(X, A.T, 0), B.T, 1), C.T, 2)
-        err = np.sum(G ** 2) - X_sq
+        err = X_sq - np.sum(G ** 2)
         thresh = np.abs(err - err_old) / err_old
         if thresh < tol:
             break
     return G, A, B, C
 
 
-def _tuckerN(X, n_components, tol, max_iter, init_type, random_state=None):
-    """Generalized Tucker decomposition."""
-    if init_type == "random":
-        components = _random_init(X, n_components, random_state)
-    elif init_type == "hosvd":
-        components = _hosvd_init(X, n_components)
-    err = 1E10
-    X_sq = np.sum(X ** 2)
+# Number of updates of each factor, and of the core, per iteration of
+# nonnegative Tucker. The terms they need are computed once per iteration,
+# so repeating the cheap updates speeds up convergence (Gillis & Glineur,
+# 2012).
+_NONNEGATIVE_TUCKER_INNER = 5
+
 
-    def mod_tmult(arg0, arg1):
-        return tmult(arg0, arg1[0], arg1[1])
+def _core_gram_product(G, grams, skip=None):
+    """Multiply the core by the Gram matrix of every factor but skip."""
+    axes = [n for n in range(G.ndim) if n != skip]
+    return multi_tmult(G, [grams[n] for n in axes], axes)
+
+
+def _tucker_nonnegative(X, components, X_sq, tol, max_iter, update="hals"):
+    """
+    Nonnegative Tucker decomposition, from initial factors.
+
+    Factor n minimizes ||X_(n) - U_n G_(n) K_n^T|| for the Kronecker product
+    K_n of the other factors, whose normal equations U_n B_n = P_n only
+    involve P_n = (X x_{m != n} U_m^T)_(n) G_(n)^T and
+    B_n = (G x_{m != n} U_m^T U_m)_(n) G_(n)^T. The factors are updated by
+    HALS or multiplicative updates of those terms, and the core by
+    multiplicative updates (Kim & Choi, 2007), all with n-mode products.
+    Factor columns are kept at unit norm, their scale moved to the core.
+    """
+    eps = np.finfo(float).eps
+    update_mode = _NONNEGATIVE_UPDATES[update]
+    components = [np.maximum(np.abs(U), eps) for U in components]
+    grams = [np.dot(U.T, U) for U in components]
+    G = np.maximum(_project(X, components), eps)
+    err = 1E10
+    info = {"update": update, "history": [], "times": []}
+    t0 = time.time()
 
     for itr in range(max_iter):
         err_old = err
 
         for idx in range(len(components)):
-            components_sublist = [components[n] for n in range(len(components))
-                                  if n != idx]
-            p1 = reduce(np.kron, components_sublist[:-1][::-1],
-                        components_sublist[-1])
-            U, S, V = linalg.svd(matricize(X, idx).dot(p1), full_matrices=False)
-            components[idx] = U[:, :n_components]
-
-        mod_components = [(c.T, idx) for idx, c in enumerate(components)]
-        G = reduce(mod_tmult, mod_components[1:], tmult(X, *mod_components[0]))
-        err = np.sum(G ** 2) - X_sq
+            Y = _project(X, components, skip=idx)
+            G_n = matricize(G, idx)
+            P_n = np.dot(matricize(Y, idx), G_n.T)
+            B_n = np.dot(matricize(_core_gram_product(G, grams, idx), idx),
+                         G_n.T)
+            U = components[idx]
+            for inner in range(_NONNEGATIVE_TUCKER_INNER):
+                U = update_mode(U, P_n, B_n, eps)
+            norms = np.sqrt((U ** 2).sum(axis=0))
+            components[idx] = U / norms
+            grams[idx] = np.dot(components[idx].T, components[idx])
+            G = tmult(G, np.diag(norms), idx)
+
+        Z = _project(X, components)
+        for inner in range(_NONNEGATIVE_TUCKER_INNER):
+            G *= Z / np.maximum(_core_gram_product(G, grams), eps)
+            np.maximum(G, eps, out=G)
+
+        # ||X||^2 - 2 <X, model> + ||model||^2 from the core terms
+        err = (X_sq - 2 * np.sum(Z * G) +
+               np.sum(_core_gram_product(G, grams) * G))
         thresh = np.abs(err - err_old) / err_old
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
         if thresh < tol:
             break
-    ret = [G]
-    ret.extend(components)
-    return ret
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    return G, components, info
+
+
+def _tuckerN(X, n_components, tol, max_iter, init_type, random_state=None,
+             cache_bytes=0, rank_tol=None, n_jobs=1, nonnegative=False):
+    """Generalized Tucker decomposition."""
+    if isinstance(X, (SlabTensor, COOTensor)):
+        unfoldings = X
+    else:
+        unfoldings = UnfoldingCache(X, cache_bytes)
+    if rank_tol is not None:
+        _, components = _st_hosvd(X, n_components, rank_tol=rank_tol)
+        ranks = [c.shape[1] for c in components]
+        if init_type != "st_hosvd":
+            components = _initialize(X, ranks, init_type, random_state,
+                                     unfoldings)
+    else:
+        ranks = _check_ranks(X, n_components)
+        components = _initialize(X, ranks, init_type, random_state,
+                                 unfoldings)
+    err = 1E10
+    X_sq = _sq_norm(X)
+    if isinstance(X, np.ndarray) and effective_n_jobs(n_jobs) > 1:
+        P = _parallel_slabs(X, n_jobs)
+    else:
+        P = X
+    if nonnegative:
+        G, components, info = _tucker_nonnegative(
+            P, components, X_sq, tol, max_iter,
+            update="mu" if nonnegative == "mu" else "hals")
+        return _tucker_output(X, P, G, components, info)
+
+    full_ranks = all(r >= d for r, d in zip(ranks, X.shape))
+    info = {"history": [], "times": []}
+    t0 = time.time()
+
+    for itr in range(max_iter):
+        err_old = err
+
+        for idx in range(len(components)):
+            Y = _project(P, components, skip=idx)
+            components[idx] = _leading_subspace(matricize(Y, idx),
+                                                ranks[idx])
+
+        # Y does not involve the last factor, so one product gives the core
+        G = tmult(Y, components[-1].T, len(components) - 1)
+        # ||X - model||^2, as the factors are orthonormal
+        err = X_sq - np.sum(G ** 2)
+        thresh = np.abs(err - err_old) / err_old
+        info["history"].append(err)
+        info["times"].append(time.time() - t0)
+        # at full ranks one iteration fits X exactly, and err is 0
+        if thresh < tol or full_ranks:
+            break
+    info["n_iter"] = itr + 1
+    info["err"] = err
+    return _tucker_output(X, P, G, components, info)
+
+
+def _tucker_output(X, P, G, components, info):
+    """
+    Core and factors as returned by tucker(), adding the metadata of the
+    slab passes over X, or over its parallel slabs P, to info.
+    """
+    if isinstance(X, SlabTensor):
+        info["chunk_throughput"] = X.throughput
+    if isinstance(P, SlabTensor):
+        _slab_info(info, P, lambda: _project(P, components, skip=0))
+    _close_slabs(X, P)
+    return [G] + list(components), info
 
 
 def tucker(X, n_components=None, tol=1E-6, max_iter=500, init_type="hosvd",
-           random_state=None):
+           random_state=None, cache_bytes=0, rank_tol=None,
+           chunk_size=None, n_jobs=1, nonnegative=False, return_info=False):
     """
     Tucker decomposition using an alternating least squares
     algorithm.
 
     Parameters
     ----------
-    X : ndarray
-        Input data to decompose
-
-    n_components : int
-        The number of components in the decomposition. Note that unlike PCA or
-        SVD, the decomposition of n_components + 1 DOES NOT contain
-        the basis from the decomposition of n_components.
+    X : ndarray, np.memmap, SlabTensor or COOTensor
+        Input data to decompose. Memory mapped and SlabTensor inputs are
+        streamed slab by slab along their first mode. Sparse COOTensor inputs
+        are projected onto the factors directly from their stored entries,
+        without densifying them.
+
+    n_components : int or tuple of int
+        The number of components in the decomposition, either shared by all
+        modes or given per mode. Note that unlike PCA or SVD, the
+        decomposition of n_components + 1 DOES NOT contain the basis from the
+        decomposition of n_components. Optional if ``rank_tol`` is given, in
+        which case it bounds the selected ranks.
 
     tol : float, optional (default=1E-4)
         Stopping tolerance for reconstruction error.
@@ -273,20 +1793,73 @@ def tucker(X, n_components=None, tol=1E-6, max_iter=500, init_type="hosvd",
         Maximum number of iterations to perform before exiting.
 
     init_type : string, optional (default="hosvd")
-        How to initialize the decomposition. Choices are "random" or "hosvd",
-        where "random" is initialized with uniform random values, and "hosvd" is
-        initialized by the high order SVD of the dataset.
+        How to initialize the decomposition. Choices are "random", "hosvd",
+        "st_hosvd" or "randomized_hosvd", where "random" is initialized with
+        uniform random values, "hosvd" is initialized by the high order SVD of
+        the dataset, "st_hosvd" by its sequentially truncated variant and
+        "randomized_hosvd" by randomized SVDs of the unfoldings, which avoids
+        the eigendecomposition of large Gram matrices. For sparse X, "hosvd"
+        uses Lanczos iterations on the sparse unfoldings, and "st_hosvd" is
+        not supported.
 
     random_state : int, None, or np.RandomState instance
-       Random seed information to use when ``init_type`` == "random"
+       Random seed information to use when ``init_type`` is "random" or
+       "randomized_hosvd"
+
+    cache_bytes : int or None, optional (default=0)
+        Memory budget in bytes for the unfoldings of X cached during the
+        decomposition. The iterations never read the unfoldings, so by
+        default none are kept beyond their use in the initialization. None
+        caches the unfolding of every mode.
+
+    rank_tol : float or None, optional (default=None)
+        Target relative reconstruction error used to select the rank of each
+        mode from its singular value spectrum. The truncated HOSVD that picks
+        the ranks has a relative error of at most ``rank_tol``. Not
+        supported when X is streamed or sparse.
+
+    chunk_size : int or None, optional (default=None)
+        Maximum number of bytes of X loaded at once when X is streamed. If
+        given, X is streamed even when it is an in-memory ndarray.
+
+    n_jobs : int, optional (default=1)
+        Number of threads projecting X onto the factors, each on a slab of X
+        along its first mode. -1 uses all cores. BLAS threads are capped
+        while the workers run so that the cores are not oversubscribed,
+        which needs the optional threadpoolctl package. Sparse inputs are
+        always processed by a single thread.
+
+    nonnegative : bool or string, optional (default=False)
+        Whether to constrain the core and the factors to be nonnegative,
+        which needs a nonnegative X. True or "hals" updates the factors
+        column by column in closed form by hierarchical ALS, and "mu" by
+        multiplicative updates. The core always uses multiplicative updates.
+        Each update is repeated a few times per iteration, reusing the
+        n-mode products it needs. Factor columns are returned at unit norm.
+
+    return_info : bool, optional (default=False)
+        Whether to also return a dictionary of metadata about the run.
 
 
     Returns
     -------
-    components : list, length = X.ndim
-        Basis functions for X, each of shape [X.shape[idx], n_components] where
-        idx is the index into ``components``. First component is a multiplier G,
-        followed by components for each mode.
+    components : list, length = X.ndim + 1
+        Basis functions for X, each of shape [X.shape[idx], n_components[idx]]
+        where idx is the index into ``components``. First component is a
+        multiplier G, followed by components for each mode.
+
+    info : dict
+        Only returned if ``return_info`` is True. Contains the number of
+        iterations "n_iter" and the final squared residual ||X - model||^2
+        "err", along with the error and the elapsed seconds after every
+        iteration in "history" and "times", so that nonnegative and HOOI
+        runs compare directly. Nonnegative decompositions give the "update"
+        used. When X is streamed, the bytes per second processed for each
+        slab of the last pass over X are given in "chunk_throughput". When
+        X is streamed or ``n_jobs`` > 1, the mean elapsed seconds of a pass
+        over the slabs of X are given in "pass_time", and with ``n_jobs`` >
+        1 the speedup of one extra projection pass on the threads over the
+        same pass on one thread in "parallel_speedup".
 
 
     References
@@ -301,9 +1874,82 @@ def tucker(X, n_components=None, tol=1E-6, max_iter=500, init_type="hosvd",
         Section 5.4.4, pp. 252-253.
 
     """
-    if n_components is None:
+    if n_components is None and rank_tol is None:
+        raise ValueError("n_components is a required argument!")
+
+    check_tensor(X)
+    if nonnegative not in (False, True, "hals", "mu"):
+        raise ValueError("nonnegative must be a bool, 'hals' or 'mu', got %r"
+                         % (nonnegative,))
+
+    X = _check_out_of_core(X, chunk_size, n_jobs)
+    if rank_tol is not None and isinstance(X, (SlabTensor, COOTensor)):
+        raise ValueError("rank_tol is not supported for out of core and "
+                         "sparse tensors")
+    try:
+        if nonnegative:
+            _check_nonnegative(X)
+        ret, info = _tuckerN(X, n_components, tol=tol, max_iter=max_iter,
+                             init_type=init_type, random_state=random_state,
+                             cache_bytes=cache_bytes, rank_tol=rank_tol,
+                             n_jobs=n_jobs, nonnegative=nonnegative)
+    finally:
+        _close_slabs(X)
+    if return_info:
+        return ret, info
+    return ret
+
+
+def hosvd(X, n_components=None, order=None, rank_tol=None):
+    """
+    Sequentially truncated higher order SVD (ST-HOSVD).
+
+    The tensor is projected onto the leading subspace of each mode as soon
+    as that mode has been processed, so later modes work on progressively
+    smaller cores instead of the full tensor.
+
+    Parameters
+    ----------
+    X : ndarray
+        Input data to decompose
+
+    n_components : int or tuple of int
+        The number of components kept for every mode, or for each mode.
+        Optional if ``rank_tol`` is given, in which case it bounds the
+        selected ranks.
+
+    order : list of int or None, optional (default=None)
+        Order in which the modes are processed. If None, modes that shrink
+        the core the most are processed first.
+
+    rank_tol : float or None, optional (default=None)
+        Target relative reconstruction error. Each mode keeps the fewest
+        components for which the discarded singular values stay within an
+        equal share of this budget.
+
+
+    Returns
+    -------
+    components : list, length = X.ndim + 1
+        A core tensor G with one axis per mode of X, followed by orthonormal
+        bases for each mode of shape [X.shape[idx], n_components[idx]].
+
+
+    References
+    ----------
+    N. Vannieuwenhoven, R. Vandebril & K. Meerbergen. A New Truncation
+        Strategy for the Higher-Order Singular Value Decomposition.
+        SIAM J. Sci. Comput. 34, A1027-A1052 (2012).
+
+    L. De Lathauwer, B. De Moor & J. Vandewalle. A Multilinear Singular Value
+        Decomposition. SIAM J. Matrix Anal. Appl. 21, 1253-1278 (2000).
+
+    """
+    if n_components is None and rank_tol is None:
         raise ValueError("n_components is a required argument!")
 
     check_tensor(X)
-    return _tuckerN(X, n_components, tol=tol, max_iter=max_iter,
-                    init_type=init_type, random_state=random_state)
+    G, components = _st_hosvd(X, n_components, order, rank_tol)
+    ret = [G]
+    ret.extend(components)
+    return ret
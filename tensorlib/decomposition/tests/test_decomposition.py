@@ -1,13 +1,33 @@
+import os
+import tempfile
 import numpy as np
+from scipy import linalg
 from tensorlib.decomposition import cp
 from tensorlib.decomposition.decomposition import _cp3
+from tensorlib.decomposition.decomposition import _cp_error
+from tensorlib.decomposition.decomposition import _cp_residual
+from tensorlib.decomposition.decomposition import _solve_gram
+from tensorlib.decomposition.decomposition import _gn_product
+from tensorlib.decomposition.decomposition import _hosvd_init
+from tensorlib.decomposition.decomposition import _randomized_hosvd_init
 from tensorlib.decomposition import tucker
+from tensorlib.decomposition import hosvd
 from tensorlib.decomposition.decomposition import _tucker3
-from tensorlib.datasets import load_bread
+from tensorlib.datasets import load_bread, load_claus
+from tensorlib.mathutils import mttkrp, tmult, SlabTensor
+from tensorlib.sparse import COOTensor
 from numpy.testing import assert_almost_equal
 from nose.tools import assert_raises
 
 
+def _fit(X, U):
+    """Least squares residual of a 3-way CP model with the last mode solved
+    for."""
+    M = mttkrp(X, U, 2)
+    C = linalg.solve(U[0].T.dot(U[0]) * U[1].T.dot(U[1]), M.T).T
+    return np.sum(X ** 2) - np.sum(M * C)
+
+
 def test_generated_cp():
     """
     Test CANDECOMP/PARFAC decomposition. Problem from
@@ -43,6 +63,475 @@ def test_generated_tucker():
     X = .7 * rs.rand(2, 4, 3) + .25 * rs.rand(2, 4, 3)
     assert_raises(ValueError, cp, X)
     U1 = tucker(X, 2, init_type="hosvd")
-    U2 = _tucker3(X, 2, tol=1E-4, max_iter=500, init_type="hosvd")
+    U2 = _tucker3(X, 2, tol=1E-6, max_iter=500, init_type="hosvd")
+    for n, i in enumerate(U1):
+        assert_almost_equal(U1[n], U2[n])
+
+
+def test_cp_error():
+    """
+    Test closed-form CP residual against the explicit reconstruction.
+    """
+    rs = np.random.RandomState(1999)
+    components = [rs.randn(d, 3) for d in (4, 5, 6)]
+    grams = [np.dot(c.T, c) for c in components]
+    model = np.einsum('ir,jr,kr->ijk', *components)
+    for X in (model + rs.randn(*model.shape), model):
+        X_sq = np.sum(X ** 2)
+        err = _cp_error(X, X_sq, components, grams,
+                        mttkrp(X, components, -1))
+        assert_almost_equal(err, np.sum((X - model) ** 2))
+    # the explicit residual of 4-way and Fortran ordered tensors
+    components.append(rs.randn(3, 3))
+    model = np.einsum('ir,jr,kr,lr->ijkl', *components)
+    X = model + rs.randn(*model.shape)
+    for Y in (X, np.asfortranarray(X)):
+        assert_almost_equal(_cp_residual(Y, components),
+                            np.sum((X - model) ** 2))
+
+
+def test_cp_solvers():
+    """
+    Test that the normal equation solvers agree and report their metadata.
+    """
+    X, meta = load_bread()
+    U1, info = cp(X, 2, init_type="hosvd", return_info=True)
+    assert info["solver"] == "cholesky"
+    assert info["n_fallbacks"] == 0
+    # no unfoldings are kept by default
+    assert info["unfold_cache_nbytes"] == 0
+    for solver in ("eigh", "pinv"):
+        U2 = cp(X, 2, init_type="hosvd", solver=solver)
+        for n, i in enumerate(U1):
+            assert_almost_equal(U1[n], U2[n])
+    U3, info = cp(X, 2, init_type="hosvd", ridge=1., return_info=True)
+    assert info["ridge"] == 1.
+    assert_raises(ValueError, cp, X, 2, solver="invalid")
+
+
+def test_solve_gram_fallback():
+    """
+    Test that singular Gram products fall back to the eigh solver.
+    """
+    rs = np.random.RandomState(1999)
+    M = rs.randn(5, 3)
+    G = np.ones((3, 3))
+    info = {"n_fallbacks": 0}
+    assert_almost_equal(_solve_gram(M, G, "cholesky", info=info),
+                        np.dot(M, np.linalg.pinv(G)))
+    assert info["n_fallbacks"] == 1
+
+
+def test_hosvd():
+    """
+    Test ST-HOSVD on a tensor with exact low multilinear rank.
+    """
+    rs = np.random.RandomState(1999)
+    G = rs.randn(2, 2, 2)
+    Us = [linalg.qr(rs.randn(d, 2), mode='economic')[0] for d in (6, 5, 4)]
+    X = tmult(tmult(tmult(G, Us[0], 0), Us[1], 1), Us[2], 2)
+    assert_raises(ValueError, hosvd, X)
+    assert_raises(ValueError, hosvd, X, 2, order=[0, 0, 1])
+    for order in (None, [2, 1, 0], [1, 0, 2]):
+        ret = hosvd(X, 2, order=order)
+        assert ret[0].shape == (2, 2, 2)
+        X_hat = tmult(tmult(tmult(ret[0], ret[1], 0), ret[2], 1), ret[3], 2)
+        assert_almost_equal(X_hat, X)
+
+    X, meta = load_bread()
+    U1 = tucker(X, 2, init_type="st_hosvd")
+    U2 = cp(X, 2, init_type="st_hosvd")
+    assert len(U1) == 4
+    assert len(U2) == 3
+    assert_raises(ValueError, cp, X, 2, init_type="invalid")
+
+
+def test_tucker_ranks():
+    """
+    Test per-mode ranks and tolerance driven rank selection.
+    """
+    X, meta = load_bread()
+    ret = tucker(X, (3, 2, 4))
+    assert ret[0].shape == (3, 2, 4)
+    for n, d in enumerate(X.shape):
+        assert ret[n + 1].shape == (d, ret[0].shape[n])
+    assert_raises(ValueError, tucker, X, (3, 2))
+
+    X_sq = np.sum(X ** 2)
+    for rank_tol in (0.05, 0.2):
+        ret = hosvd(X, rank_tol=rank_tol)
+        err = X_sq - np.sum(ret[0] ** 2)
+        assert err <= rank_tol ** 2 * X_sq
+        # full ranks give an exact fit, without a division by zero
+        with np.errstate(all="raise"):
+            ret = tucker(X, rank_tol=rank_tol, init_type="st_hosvd")
+        assert np.sum(ret[0] ** 2) >= (1 - rank_tol ** 2) * X_sq
+    ret = tucker(X, 2, rank_tol=0.05)
+    assert max(ret[0].shape) <= 2
+
+
+def test_randomized_hosvd_init():
+    """
+    Test that randomized HOSVD recovers the same subspaces as HOSVD.
+    """
+    rs = np.random.RandomState(1999)
+    G = rs.randn(2, 2, 2)
+    Us = [linalg.qr(rs.randn(d, 2), mode='economic')[0] for d in (30, 20, 25)]
+    X = tmult(tmult(tmult(G, Us[0], 0), Us[1], 1), Us[2], 2)
+    U1 = _randomized_hosvd_init(X, 2, random_state=0)
+    U2 = _hosvd_init(X, 2)
+    for n in range(X.ndim):
+        assert_almost_equal(np.abs(U1[n].T.dot(U2[n])), np.eye(2))
+    U3 = _randomized_hosvd_init(X, 2, random_state=0)
+    for n in range(X.ndim):
+        assert_almost_equal(U1[n], U3[n])
+    U = cp(X, 2, init_type="randomized_hosvd", random_state=0)
+    assert len(U) == 3
+
+
+def test_out_of_core():
+    """
+    Test that streaming a memory mapped tensor matches the in-memory path.
+    """
+    X, meta = load_bread()
+    X = X.astype(np.float64)
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        X_mm = np.memmap(fname, dtype=X.dtype, mode='w+', shape=X.shape)
+        X_mm[:] = X
+        X_mm.flush()
+        chunk_size = 3 * X[0].nbytes
+        U1 = cp(X, 2, init_type="hosvd")
+        U2, info = cp(X_mm, 2, init_type="hosvd", chunk_size=chunk_size,
+                      return_info=True)
+        for n, i in enumerate(U1):
+            assert_almost_equal(U1[n], U2[n])
+        assert len(info["chunk_throughput"]) == 4
+
+        U1 = tucker(X, 2)
+        U2, info = tucker(X_mm, 2, chunk_size=chunk_size, return_info=True)
+        for n, i in enumerate(U1):
+            assert_almost_equal(U1[n], U2[n])
+        assert len(info["chunk_throughput"]) == 4
+        assert_raises(ValueError, tucker, X_mm, rank_tol=0.1)
+        assert_raises(ValueError, cp, X_mm, 2, init_type="st_hosvd")
+        del X_mm
+    finally:
+        os.remove(fname)
+
+
+def test_n_jobs():
+    """
+    Test that thread-parallel decompositions match the serial ones.
+    """
+    X, meta = load_bread()
+    U1 = cp(X, 2, init_type="hosvd")
+    U2, info = cp(X, 2, init_type="hosvd", n_jobs=3, return_info=True)
+    for n, i in enumerate(U1):
+        assert_almost_equal(U1[n], U2[n])
+    assert info["pass_time"] > 0
+    assert info["parallel_speedup"] > 0
+    U1 = tucker(X, 2)
+    U2, info = tucker(X, 2, n_jobs=2, return_info=True)
+    for n, i in enumerate(U1):
+        assert_almost_equal(U1[n], U2[n])
+    assert info["pass_time"] > 0
+    assert info["parallel_speedup"] > 0
+
+
+def test_multi_start():
+    """
+    Test that multi-start CP keeps the lowest residual restart.
+    """
+    X, meta = load_bread()
+    U1, info1 = cp(X, 2, init_type="hosvd", return_info=True)
+    U2, info2 = cp(X, 2, init_type="hosvd", n_init=4, n_jobs=2,
+                   random_state=1999, return_info=True)
+    assert len(info2["runs"]) == 4
+    assert info2["runs"][0]["init_type"] == "hosvd"
+    assert info2["runs"][1]["init_type"] == "random"
+    fits = [run["fit"] for run in info2["runs"]]
+    assert info2["fit"] == min(fits)
+    assert info2["fit"] <= info1["fit"] + 1E-8 * abs(info1["fit"])
+    assert_almost_equal(fits[0], info1["fit"])
+    U3, info3 = cp(X, 2, init_type="hosvd", n_init=4, random_state=1999,
+                   return_info=True)
+    assert_almost_equal(info3["err"], info2["err"])
+    assert_raises(ValueError, cp, X, 2, n_init=0)
+
+    # restarts are ranked by their true residual, which the error of the
+    # normalized factors does not reflect
+    X, meta = load_claus()
+    X = X.astype(np.float64)
+    U, info = cp(X, 3, init_type="random", n_init=6, random_state=0,
+                 return_info=True)
+    fits = [run["fit"] for run in info["runs"]]
+    assert info["best_run"] == np.argmin(fits)
+    assert_almost_equal(_fit(X, U) / info["fit"], 1.)
+    for run in info["runs"]:
+        if not run["stopped_early"]:
+            V = cp(X, 3, init_type="random", random_state=run["random_state"])
+            assert _fit(X, V) >= (1 - 1E-8) * _fit(X, U)
+
+
+def test_line_search():
+    """
+    Test that line search extrapolation converges in fewer iterations to an
+    equally good fit.
+    """
+    X, meta = load_claus()
+    X = X.astype(np.float64)
+    U1, info1 = cp(X, 3, init_type="random", random_state=1, tol=1E-8,
+                   return_info=True)
+    U2, info2 = cp(X, 3, init_type="random", random_state=1, tol=1E-8,
+                   line_search=2, return_info=True)
+    assert len(info1["line_search_accepted"]) == 0
+    assert len(info2["line_search_accepted"]) > 0
+    assert info2["n_iter"] < info1["n_iter"]
+    assert len(info2["history"]) == len(info2["times"]) == info2["n_iter"]
+    assert info2["history"][-1] == info2["err"]
+    assert_almost_equal(_fit(X, U2) / _fit(X, U1), 1., decimal=3)
+    assert_raises(ValueError, cp, X, 3, line_search=0)
+
+
+def test_sparse_cp():
+    """
+    Test that CP on a sparse tensor matches CP on its dense equivalent.
+    """
+    X, meta = load_bread()
+    X = X * (X > np.median(X))
+    S = COOTensor.from_dense(X)
+    U1 = cp(X, 2, init_type="hosvd")
+    U2, info = cp(S, 2, init_type="hosvd", return_info=True)
     for n, i in enumerate(U1):
         assert_almost_equal(U1[n], U2[n])
+    assert_raises(ValueError, cp, S, 2, init_type="st_hosvd")
+    U4 = _randomized_hosvd_init(S, 2, random_state=0)
+    for n, U in enumerate(_hosvd_init(X, 2)):
+        assert_almost_equal(U, U4[n])
+    assert_almost_equal(_cp_residual(S, U2), _cp_residual(X, U2))
+    for csf in ("single", None):
+        U3, info = cp(S, 2, init_type="hosvd", csf=csf, return_info=True)
+        for n, i in enumerate(U1):
+            assert_almost_equal(U1[n], U3[n])
+        assert (info["cache_nbytes"] > 0) == (csf is not None)
+
+
+def test_sparse_tucker():
+    """
+    Test that Tucker on a sparse tensor matches Tucker on its dense
+    equivalent.
+    """
+    X, meta = load_bread()
+    X = X * (X > np.median(X))
+    S = COOTensor.from_dense(X)
+    U1 = tucker(X, (3, 2, 2))
+    U2 = tucker(S, (3, 2, 2))
+    for n, i in enumerate(U1):
+        assert_almost_equal(U1[n], U2[n])
+    assert_raises(ValueError, tucker, S, rank_tol=0.1)
+
+
+def test_accelerated_als():
+    """
+    Test that accelerated ALS converges in fewer iterations to an equally
+    good fit.
+    """
+    X, meta = load_claus()
+    X = X.astype(np.float64)
+    U1, info1 = cp(X, 3, init_type="random", random_state=1, tol=1E-8,
+                   return_info=True)
+    U2, info2 = cp(X, 3, init_type="random", random_state=1, tol=1E-8,
+                   algorithm="accelerated_als", return_info=True)
+    assert info2["n_iter"] < info1["n_iter"]
+    assert "n_restarts" in info2
+    M = [mttkrp(X, U, 2) for U in (U1, U2)]
+    fits = [np.sum(X ** 2) - np.sum(m * linalg.solve(
+        U[0].T.dot(U[0]) * U[1].T.dot(U[1]), m.T).T)
+        for m, U in zip(M, (U1, U2))]
+    assert_almost_equal(fits[1] / fits[0], 1., decimal=3)
+    assert_raises(ValueError, cp, X, 3, algorithm="invalid")
+    assert_raises(ValueError, cp, X, 3, algorithm="accelerated_als",
+                  line_search=2)
+
+
+def test_lm():
+    """
+    Test the Gauss-Newton products and that Levenberg-Marquardt converges
+    in fewer iterations than ALS.
+    """
+    rs = np.random.RandomState(1999)
+    U = [rs.randn(d, 2) for d in (3, 4, 5)]
+    V = [rs.randn(d, 2) for d in (3, 4, 5)]
+    # explicit Jacobian of the vectorized model, one column per parameter
+    J = []
+    for n in range(3):
+        for i in range(U[n].shape[0]):
+            for r in range(2):
+                D = [u.copy() for u in U]
+                D[n] = np.zeros_like(U[n])
+                D[n][i, r] = 1.
+                J.append(np.einsum('ir,jr,kr->ijk', *D).ravel())
+    J = np.array(J).T
+    v = np.concatenate([w.ravel() for w in V])
+    JtJv = _gn_product(U, [np.dot(u.T, u) for u in U], V)
+    assert_almost_equal(np.concatenate([w.ravel() for w in JtJv]),
+                        J.T.dot(J.dot(v)))
+
+    X, meta = load_bread()
+    U1, info1 = cp(X, 3, init_type="random", random_state=0, tol=1E-8,
+                   max_iter=2000, return_info=True)
+    U2, info2 = cp(X, 3, init_type="random", random_state=0, tol=1E-8,
+                   max_iter=2000, algorithm="lm", return_info=True)
+    assert info2["n_iter"] < info1["n_iter"] / 4
+    X_hat = np.einsum('ir,jr,kr->ijk', *U2)
+    assert_almost_equal(np.sum((X - X_hat) ** 2) / info2["err"], 1.)
+    M = mttkrp(X, U1, 2)
+    fit1 = np.sum(X ** 2) - np.sum(M * linalg.solve(
+        U1[0].T.dot(U1[0]) * U1[1].T.dot(U1[1]), M.T).T)
+    assert info2["err"] <= fit1 * (1 + 1E-6)
+    assert len(info2["cg_iterations"]) == info2["n_iter"]
+
+
+def test_randomized_cp():
+    """
+    Test that sampled CP-ALS recovers a low rank tensor.
+    """
+    rs = np.random.RandomState(1999)
+    U = [rs.rand(d, 3) for d in (40, 30, 20)]
+    X = np.einsum('ir,jr,kr->ijk', *U)
+    X += 1E-3 * rs.randn(*X.shape)
+    # the noisy sampled updates must not stop the decomposition early,
+    # whatever the starting point
+    for init_type, seed in [("random", 0), ("random", 1), ("random", 3),
+                            ("random", 6), ("random", 7), ("hosvd", 5)]:
+        V, info = cp(X, 3, init_type=init_type, algorithm="randomized",
+                     random_state=seed, return_info=True)
+        X_hat = np.einsum('ir,jr,kr->ijk', *V)
+        assert np.sum((X - X_hat) ** 2) / np.sum(X ** 2) < 1E-4
+        assert info["n_samples"] in (33, 66, 132, 264)
+        assert len(info["history"]) == info["n_iter"]
+        assert info["err"] == min(info["history"])
+    V, info = cp(X, 3, init_type="random", algorithm="randomized",
+                 random_state=0, return_info=True)
+    # the stopping rule does not depend on the scale of X
+    V, info2 = cp(1E5 * X, 3, init_type="random", algorithm="randomized",
+                  random_state=0, return_info=True)
+    assert info2["n_iter"] == info["n_iter"]
+    assert_almost_equal(info2["err"] / info["err"] / 1E10, 1.)
+    V2 = cp(X, 3, init_type="random", algorithm="randomized",
+            random_state=0, n_samples=200)
+    V3 = cp(X, 3, init_type="random", algorithm="randomized",
+            random_state=0, n_samples=200)
+    for n in range(3):
+        assert_almost_equal(V2[n], V3[n])
+    assert_raises(ValueError, cp, X, 3, algorithm="randomized", n_samples=0)
+    assert_raises(ValueError, cp, X, 3, algorithm="randomized", n_init=2)
+    assert_raises(ValueError, cp, COOTensor.from_dense(X), 3,
+                  algorithm="randomized")
+
+
+def test_tensorsketch_cp():
+    """
+    Test that sketched CP-ALS recovers a low rank tensor from dense and
+    sparse inputs.
+    """
+    rs = np.random.RandomState(1999)
+    U = [rs.rand(d, 3) for d in (40, 30, 20)]
+    X = np.einsum('ir,jr,kr->ijk', *U)
+    X += 1E-3 * rs.randn(*X.shape)
+    for T in (X, COOTensor.from_dense(X)):
+        V, info = cp(T, 3, init_type="random", algorithm="tensorsketch",
+                     random_state=0, return_info=True)
+        X_hat = np.einsum('ir,jr,kr->ijk', *V)
+        assert np.sum((X - X_hat) ** 2) / np.sum(X ** 2) < 1E-4
+        assert info["sketch_size"] == 512
+        assert len(info["history"]) == info["n_iter"]
+    assert_raises(ValueError, cp, X, 3, algorithm="tensorsketch",
+                  sketch_size=0)
+    assert_raises(ValueError, cp, X, 3, algorithm="tensorsketch", n_init=2)
+
+
+def test_nonnegative_cp():
+    """
+    Test that nonnegative CP gives nonnegative factors fitting the
+    fluorescence data as well as unconstrained ALS.
+    """
+    X, meta = load_claus()
+    X = np.maximum(X.astype(np.float64), 0)
+    U, info = cp(X, 3, init_type="random", random_state=0, tol=1E-6,
+                 return_info=True)
+    M = mttkrp(X, U, 2)
+    fit = np.sum(X ** 2) - np.sum(M * linalg.solve(
+        U[0].T.dot(U[0]) * U[1].T.dot(U[1]), M.T).T)
+    for nonnegative in (True, "mu"):
+        V, info = cp(X, 3, init_type="random", random_state=0, tol=1E-6,
+                     max_iter=300, nonnegative=nonnegative,
+                     return_info=True)
+        assert all((v >= 0).all() for v in V)
+        X_hat = np.einsum('ir,jr,kr->ijk', *V)
+        assert_almost_equal(np.sum((X - X_hat) ** 2) / info["err"], 1.)
+        assert info["err"] < 1.01 * fit
+    assert info["update"] == "mu"
+    assert_raises(ValueError, cp, X, 3, nonnegative="invalid")
+    assert_raises(ValueError, cp, X, 3, nonnegative=True, algorithm="lm")
+    X[0, 0, 0] = -1.
+    assert_raises(ValueError, cp, X, 3, nonnegative="mu")
+
+
+def test_nonnegative_tucker():
+    """
+    Test that nonnegative Tucker keeps the core and factors nonnegative and
+    fits nearly as well as HOOI, with per-mode ranks.
+    """
+    X, meta = load_claus()
+    X = np.maximum(X.astype(np.float64), 0)
+    ranks = (2, 4, 3)
+    (G, A, B, C), info = tucker(X, ranks, return_info=True)
+    hooi = np.sum((X - np.einsum('abc,ia,jb,kc->ijk', G, A, B, C)) ** 2)
+    # HOOI records the same squared residual as the nonnegative updates
+    assert_almost_equal(info["err"] / hooi, 1.)
+    assert info["history"][-1] == info["err"]
+    for nonnegative in (True, "mu"):
+        ret, info = tucker(X, ranks, tol=1E-5, nonnegative=nonnegative,
+                           return_info=True)
+        G, A, B, C = ret
+        assert G.shape == ranks
+        assert all((U >= 0).all() for U in ret)
+        assert_almost_equal((A ** 2).sum(axis=0), np.ones(2))
+        err = np.sum((X - np.einsum('abc,ia,jb,kc->ijk', G, A, B, C)) ** 2)
+        assert_almost_equal(err / info["err"], 1.)
+        assert err < 1.02 * hooi
+        assert len(info["times"]) == info["n_iter"]
+    assert info["update"] == "mu"
+    assert_raises(ValueError, tucker, X, 2, nonnegative="invalid")
+    X[0, 0, 0] = -1.
+    for T in (X, COOTensor.from_dense(X), SlabTensor(X, X[:2].nbytes)):
+        assert_raises(ValueError, tucker, T, 2, nonnegative=True)
+
+
+def test_missing_cp():
+    """
+    Test that CP with missing entries fits the observed entries and
+    predicts the missing ones, by EM or weighted least squares.
+    """
+    rs = np.random.RandomState(1999)
+    U = [rs.rand(d, 3) for d in (20, 15, 10)]
+    X_true = np.einsum('ir,jr,kr->ijk', *U)
+    X_noisy = X_true + 1E-3 * rs.randn(*X_true.shape)
+    for rate, strategy in ((.1, "em"), (.6, "weighted")):
+        mask = rs.rand(*X_true.shape) > rate
+        X = np.where(mask, X_noisy, np.nan)
+        V, info = cp(X, 3, tol=1E-10, return_info=True)
+        assert info["missing_strategy"] == strategy
+        X_hat = np.einsum('ir,jr,kr->ijk', *V)
+        assert_almost_equal(np.sum(mask * (X_noisy - X_hat) ** 2) /
+                            info["err"], 1.)
+        assert np.sum((X_true - X_hat) ** 2) / np.sum(X_true ** 2) < 1E-5
+        # an explicit mask hides entries the same way as NaNs
+        V2 = cp(X_noisy, 3, tol=1E-10, mask=mask)
+        for n in range(3):
+            assert_almost_equal(V[n], V2[n])
+    assert_raises(ValueError, cp, X, 3, algorithm="lm")
+    assert_raises(ValueError, cp, X_true, 3, mask=mask[0])
@@ -2,7 +2,14 @@
 # Authors: Kyle Kastner <kastnerkyle@gmail.com>
 #          Michael Eickenberg <michael.eickenberg@gmail.com>
 # License: BSD 3-Clause
+import time
 import numpy as np
+from collections import OrderedDict
+from functools import reduce
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from scipy import sparse
+from .utils import check_random_state, effective_n_jobs, limit_blas_threads
 
 
 def kr(B, C):
@@ -37,6 +44,77 @@ def kr(B, C):
     return np.einsum('ij, kj -> ikj', B, C).reshape(m * n, p)
 
 
+def kr_many(matrices, out=None, row_block=None):
+    """
+    Calculate the Khatri-Rao product of a list of 2D matrices.
+
+    Equivalent to ``reduce(kr, matrices)``, but only the output is allocated
+    at full size, instead of every pairwise intermediate.
+
+    Parameters
+    ----------
+    matrices : list of ndarray
+        Matrices of shape [n_i, p], the first one varying slowest along the
+        rows of the product.
+    out : ndarray or None, optional (default=None)
+        C-contiguous array of shape [n_1 * ... * n_k, p] to store the result
+        in.
+    row_block : int or None, optional (default=None)
+        If given, return a generator yielding consecutive blocks of at most
+        ``row_block`` rows of the product instead of the full product.
+
+    Returns
+    -------
+    A : ndarray, shape = [n_1 * ... * n_k, p], or generator of ndarray
+
+    """
+    matrices = [np.asarray(M) for M in matrices]
+    if len(matrices) == 0:
+        raise ValueError("At least one matrix is required")
+    if any(M.ndim != 2 for M in matrices):
+        raise ValueError("All matrices must have 2 dimensions")
+    p = matrices[0].shape[1]
+    if any(M.shape[1] != p for M in matrices):
+        raise ValueError("All matrices must have the same number of columns")
+    if row_block is not None:
+        if out is not None:
+            raise ValueError("out cannot be combined with row_block")
+        return _kr_blocks(matrices, int(row_block))
+
+    n_rows = int(np.prod([M.shape[0] for M in matrices]))
+    if out is None:
+        out = np.empty((n_rows, p), dtype=np.result_type(*matrices))
+    elif out.shape != (n_rows, p) or not out.flags.c_contiguous:
+        raise ValueError("out must be a C-contiguous array of shape %s"
+                         % ((n_rows, p),))
+    if len(matrices) == 1:
+        out[...] = matrices[0]
+        return out
+    # Only the last product is full size, everything before it is
+    # smaller by a factor of the number of rows of the last matrix.
+    left = kr_many(matrices[:-1]) if len(matrices) > 2 else matrices[0]
+    last = matrices[-1]
+    np.einsum('ij, kj -> ikj', left, last,
+              out=out.reshape(left.shape[0], last.shape[0], p))
+    return out
+
+
+def _kr_blocks(matrices, row_block):
+    """
+    Generate consecutive row blocks of the Khatri-Rao product.
+    """
+    shape = [M.shape[0] for M in matrices]
+    n_rows = int(np.prod(shape))
+    dtype = np.result_type(*matrices)
+    for start in range(0, n_rows, row_block):
+        rows = np.arange(start, min(start + row_block, n_rows))
+        idx = np.unravel_index(rows, shape)
+        block = np.array(matrices[0][idx[0]], dtype=dtype)
+        for M, i in zip(matrices[1:], idx[1:]):
+            block *= M[i]
+        yield block
+
+
 def _canonical_kr(B, C):
     """
     Internal implementation of vanilla kr product.
@@ -49,6 +127,170 @@ def _canonical_kr(B, C):
     return A
 
 
+def _contract_factors(T, factors, axes, rank_axis=False):
+    """
+    Contract the axes of T against the matching factor matrices, sharing the
+    component index between all factors.
+
+    Parameters
+    ----------
+    T : ndarray
+        If ``rank_axis`` is True, the last axis of T indexes the components.
+    factors : list of ndarray
+        One matrix of shape [T.shape[axis], n_components] per entry in axes.
+    axes : list of int
+        Axes of T to contract, excluding the component axis.
+    rank_axis : bool, optional (default=False)
+        Whether T already carries a trailing component axis.
+
+    Returns
+    -------
+    T_contracted : ndarray
+        The remaining axes of T in their original order, followed by a
+        component axis.
+
+    """
+    labels = list(range(T.ndim - 1 if rank_axis else T.ndim))
+    pending = sorted(zip(axes, factors), key=lambda a: T.shape[a[0]],
+                     reverse=True)
+    if not rank_axis:
+        # The first contraction introduces the component axis. Doing it over
+        # an outer axis makes the reshape inside tensordot free and touches
+        # every entry of T exactly once in a single GEMM.
+        outer = [p for p in pending if p[0] in (0, T.ndim - 1)]
+        first = outer[0] if len(outer) > 0 else pending[0]
+        pending.remove(first)
+        axis, U = first
+        if axis == 0:
+            T = np.moveaxis(np.tensordot(U, T, axes=(0, 0)), 0, -1)
+        else:
+            T = np.tensordot(T, U, axes=(axis, 0))
+        labels.remove(axis)
+    for axis, U in pending:
+        pos = labels.index(axis)
+        T = np.einsum('...ir,ir->...r', np.moveaxis(T, pos, -2), U)
+        labels.remove(axis)
+    return T
+
+
+def mttkrp(X, factors, axis):
+    """
+    Matricized tensor times Khatri-Rao product.
+
+    Computes ``matricize(X, axis).dot(p)``, where ``p`` is the Khatri-Rao
+    product of all factors except ``factors[axis]`` in the column ordering used
+    by ``matricize``, without ever forming ``p``. The tensor is contracted
+    against the factors one mode at a time instead.
+
+    Parameters
+    ----------
+    X : ndarray, shape = [d1, ..., dn]
+    factors : list of ndarray, length = X.ndim
+        Factor matrices, each of shape [X.shape[idx], n_components].
+        ``factors[axis]`` is ignored.
+    axis : int
+
+    Returns
+    -------
+    M : ndarray, shape = [d_axis, n_components]
+
+    """
+    if axis < 0:
+        axis = X.ndim + axis
+    if len(factors) != X.ndim:
+        raise ValueError("One factor per mode of X is required")
+    others = [n for n in range(X.ndim) if n != axis]
+    for n in others:
+        if factors[n].shape[0] != X.shape[n]:
+            raise ValueError("Factor %i does not match mode %i of X" % (n, n))
+    return _contract_factors(X, [factors[n] for n in others], others)
+
+
+class DimensionTree(object):
+    """
+    Memoized MTTKRP over a binary tree of mode ranges.
+
+    Each node of the tree covers a contiguous range of modes ``[lo, hi)`` and
+    holds X contracted with every factor outside that range, with a trailing
+    component axis. A node is computed from its parent by contracting the
+    sibling modes, so consecutive modes of an ALS sweep share all of the
+    contractions above their common ancestor. Only the two children of the
+    root touch the full tensor, giving two full-size contractions per sweep
+    instead of one per mode. If X is a SlabTensor, those two contractions
+    stream over its slabs, on its thread pool if it has one.
+
+    Parameters
+    ----------
+    X : ndarray or SlabTensor, shape = [d1, ..., dn]
+    factors : list of ndarray, length = X.ndim
+        Initial factor matrices, each of shape [X.shape[idx], n_components].
+
+    Attributes
+    ----------
+    nbytes : int
+        Number of bytes currently held by cached partial contractions.
+
+    """
+    def __init__(self, X, factors):
+        if len(factors) != X.ndim:
+            raise ValueError("One factor per mode of X is required")
+        self.X = X
+        self.factors = list(factors)
+        self._cache = {}
+
+    @property
+    def nbytes(self):
+        return sum(T.nbytes for T in self._cache.values())
+
+    def update(self, axis, factor):
+        """
+        Replace the factor for one mode and drop the cached nodes it affects.
+        """
+        if axis < 0:
+            axis = self.X.ndim + axis
+        self.factors[axis] = factor
+        # A node depends on every factor outside its range
+        for key in list(self._cache.keys()):
+            if not key[0] <= axis < key[1]:
+                del self._cache[key]
+
+    def _node(self, lo, hi, parent):
+        key = (lo, hi)
+        if key not in self._cache:
+            if parent is None:
+                T, rank_axis, offset = self.X, False, 0
+                axes = [n for n in range(self.X.ndim) if not lo <= n < hi]
+                if isinstance(self.X, SlabTensor):
+                    self._cache[key] = self.X.contract(
+                        [self.factors[n] for n in axes], axes)
+                    return key
+            else:
+                T, rank_axis, offset = self._cache[parent], True, parent[0]
+                axes = [n for n in range(parent[0], parent[1])
+                        if not lo <= n < hi]
+            self._cache[key] = _contract_factors(
+                T, [self.factors[n] for n in axes],
+                [n - offset for n in axes], rank_axis=rank_axis)
+        return key
+
+    def mttkrp(self, axis):
+        """
+        Equivalent to ``mttkrp(X, factors, axis)`` for the current factors.
+        """
+        if axis < 0:
+            axis = self.X.ndim + axis
+        lo, hi = 0, self.X.ndim
+        parent = None
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if axis < mid:
+                hi = mid
+            else:
+                lo = mid
+            parent = self._node(lo, hi, parent)
+        return self._cache[parent]
+
+
 def matricize(X, axis):
     """
     Returns flattened version of tensor.
@@ -78,6 +320,66 @@ def matricize(X, axis):
     return X.transpose(axis, *not_axis).reshape(X.shape[axis], -1)
 
 
+class UnfoldingCache(object):
+    """
+    Least recently used cache of the unfoldings of a constant tensor.
+
+    Each mode's unfolding is computed by ``matricize`` at most once while it
+    stays in the cache. Modes whose unfolding is a view of X (no transpose
+    copy is needed for the memory layout of X) are returned directly and do
+    not count against the budget.
+
+    Parameters
+    ----------
+    X : ndarray, shape = [d1, ..., dn]
+    max_bytes : int or None, optional (default=None)
+        Memory budget for cached unfoldings. Least recently used unfoldings
+        are evicted once it is exceeded. None caches every mode.
+
+    Attributes
+    ----------
+    nbytes : int
+        Number of bytes currently held by cached unfoldings.
+
+    """
+    def __init__(self, X, max_bytes=None):
+        self.X = X
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+
+    @property
+    def nbytes(self):
+        return sum(U.nbytes for U in self._cache.values())
+
+    def unfold(self, axis):
+        """
+        Equivalent to ``matricize(X, axis)``.
+        """
+        if axis < 0:
+            axis = self.X.ndim + axis
+        if axis in self._cache:
+            U = self._cache.pop(axis)
+            self._cache[axis] = U
+            return U
+        U = matricize(self.X, axis)
+        if np.may_share_memory(U, self.X):
+            return U
+        if self.max_bytes is not None:
+            if U.nbytes > self.max_bytes:
+                return U
+            while self.nbytes + U.nbytes > self.max_bytes:
+                self._cache.popitem(last=False)
+        self._cache[axis] = U
+        return U
+
+    def gram(self, axis):
+        """
+        Equivalent to ``matricize(X, axis).dot(matricize(X, axis).T)``.
+        """
+        U = self.unfold(axis)
+        return U.dot(U.T)
+
+
 def unmatricize(X, axis, dims):
     """
     Returns reshaped tensor, reverses matricize operation.
@@ -123,24 +425,374 @@ def sign_flip(X):
     return signs * X
 
 
-def tmult(X, M, axis):
+def tmult(X, M, axis, out=None):
     """
     Tensor multiplication (also known as n-mode multiplication)
     Given an array X of shape (n, m, p) and a matrix M of shape (r, m)
     multiplying along the 2nd dimension (axis 1) will result in a new tensor
     of shape (n, r, p).
 
+    The product is a single batched matrix multiplication over a reshaped
+    view of X, without an explicit matricize/unmatricize round trip.
+
     Parameters
     ----------
     X : array-like
     M : array-like
     axis : int
+    out : ndarray or None, optional (default=None)
+        C-contiguous array of the output shape to store the result in.
 
     Returns
     -------
     T : ndarray
 
     """
-    tensor_shape = list(X.shape)
-    tensor_shape[axis] = M.shape[0]
-    return unmatricize(M.dot(matricize(X, axis)), axis, tensor_shape)
+    X = np.asarray(X)
+    M = np.asarray(M)
+    if axis < 0:
+        axis = X.ndim + axis
+    if M.ndim != 2 or M.shape[1] != X.shape[axis]:
+        raise ValueError("M must be a matrix with %i columns to multiply "
+                         "axis %i of X" % (X.shape[axis], axis))
+    shape = X.shape[:axis] + (M.shape[0],) + X.shape[axis + 1:]
+    if out is None:
+        out = np.empty(shape, dtype=np.result_type(X, M))
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError("out must be a C-contiguous array of shape %s"
+                         % (shape,))
+    before = int(np.prod(X.shape[:axis]))
+    after = int(np.prod(X.shape[axis + 1:]))
+    np.matmul(M, X.reshape(before, X.shape[axis], after),
+              out=out.reshape(before, M.shape[0], after))
+    return out
+
+
+def multi_tmult(X, matrices, axes):
+    """
+    Apply a list of n-mode products, ``tmult(X, matrices[i], axes[i])``.
+
+    The products are applied in the order that shrinks the tensor the
+    fastest, so the largest intermediates are avoided.
+
+    Parameters
+    ----------
+    X : array-like
+    matrices : list of array-like
+    axes : list of int
+        One distinct axis of X per matrix.
+
+    Returns
+    -------
+    T : ndarray
+
+    """
+    X = np.asarray(X)
+    if len(matrices) != len(axes):
+        raise ValueError("One axis per matrix is required")
+    axes = [a + X.ndim if a < 0 else a for a in axes]
+    if len(set(axes)) != len(axes):
+        raise ValueError("Each axis can only be multiplied once")
+    steps = sorted(zip(axes, matrices),
+                   key=lambda s: float(np.shape(s[1])[0]) / X.shape[s[0]])
+    for axis, M in steps:
+        X = tmult(X, M, axis)
+    return X
+
+
+class SlabTensor(object):
+    """
+    Out-of-core access to a tensor, one slab of bounded size at a time.
+
+    X is only ever indexed with slices along a single axis, so it can be a
+    ``np.memmap`` or any array-like with ``shape`` and ``dtype`` attributes
+    whose slices are ndarrays (for example an HDF5 dataset). Every operation
+    streams over the slabs and holds at most ``chunk_size`` bytes of X in
+    memory per worker.
+
+    With ``n_jobs`` > 1 the slabs are processed on a thread pool, which is
+    effective because numpy releases the GIL in its kernels. BLAS threads
+    are capped while the pool runs so the workers do not oversubscribe the
+    cores, if threadpoolctl is installed. The pool is started by the first
+    parallel pass and reused by the following ones until ``close`` is
+    called.
+
+    Parameters
+    ----------
+    X : array-like, shape = [d1, ..., dn]
+    chunk_size : int, optional (default=2 ** 26)
+        Maximum number of bytes of X loaded per slab. At least one index
+        along the slab axis is always loaded.
+    n_jobs : int, optional (default=1)
+        Number of threads processing slabs. -1 uses all cores.
+
+    Attributes
+    ----------
+    throughput : list of float
+        Bytes per second processed for each slab of the most recent pass,
+        including the work done on the slab.
+    n_passes : int
+        Number of passes over the slabs of X.
+    wall_time : float
+        Seconds elapsed while processing slabs, summed over all passes.
+
+    """
+    def __init__(self, X, chunk_size=2 ** 26, n_jobs=1):
+        self.X = X
+        self.chunk_size = chunk_size
+        self.n_jobs = effective_n_jobs(n_jobs)
+        self.shape = tuple(X.shape)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(X.dtype)
+        self.throughput = []
+        self._pool = None
+        self.n_passes = 0
+        self.wall_time = 0.
+
+    def _bounds(self, axis):
+        n_bytes = self.dtype.itemsize * int(np.prod(self.shape))
+        step = max(1, int(self.chunk_size * self.shape[axis] // n_bytes))
+        return [(start, min(start + step, self.shape[axis]))
+                for start in range(0, self.shape[axis], step)]
+
+    def _load(self, axis, start, stop):
+        index = (slice(None),) * axis + (slice(start, stop),)
+        return np.asarray(self.X[index])
+
+    def slabs(self, axis=0):
+        """
+        Generate (start, stop, slab) for consecutive slabs along axis.
+        """
+        self.throughput = []
+        for start, stop in self._bounds(axis):
+            t0 = time.time()
+            slab = self._load(axis, start, stop)
+            yield start, stop, slab
+            self.throughput.append(slab.nbytes / max(time.time() - t0,
+                                                     1E-9))
+
+    def map(self, func, axis=0):
+        """
+        Generate (start, stop, func(start, stop, slab)) in slab order.
+
+        Slabs are processed on a thread pool if ``n_jobs`` > 1.
+        """
+        def work(bounds):
+            t0 = time.time()
+            slab = self._load(axis, *bounds)
+            res = func(bounds[0], bounds[1], slab)
+            return bounds, res, slab.nbytes, time.time() - t0
+
+        bounds = self._bounds(axis)
+        self.throughput = []
+        t0 = time.time()
+        if self.n_jobs > 1 and len(bounds) > 1:
+            blas_limit = limit_blas_threads(
+                max(1, cpu_count() // self.n_jobs))
+            if self._pool is None:
+                self._pool = ThreadPool(self.n_jobs)
+            results = self._pool.imap(work, bounds)
+        else:
+            blas_limit = limit_blas_threads(None)
+            results = (work(b) for b in bounds)
+        try:
+            with blas_limit:
+                for (start, stop), res, n_bytes, elapsed in results:
+                    self.throughput.append(n_bytes / max(elapsed, 1E-9))
+                    yield start, stop, res
+        finally:
+            self.n_passes += 1
+            self.wall_time += time.time() - t0
+
+    def close(self):
+        """
+        Stop the thread pool, if one was started. A later parallel pass
+        starts a new one.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def sq_norm(self):
+        """
+        Squared Frobenius norm of X.
+        """
+        return sum(res for _, _, res in
+                   self.map(lambda start, stop, slab: np.sum(slab ** 2.)))
+
+    def gram(self, axis):
+        """
+        Equivalent to ``matricize(X, axis).dot(matricize(X, axis).T)``.
+
+        The Gram matrix is accumulated over slabs along another axis, so
+        each slab contributes a full-size term in a single pass.
+        """
+        if axis < 0:
+            axis = self.ndim + axis
+
+        def slab_gram(start, stop, slab):
+            U = matricize(slab, axis)
+            return U.dot(U.T)
+
+        G = np.zeros((self.shape[axis], self.shape[axis]))
+        for _, _, res in self.map(slab_gram, 1 if axis == 0 else 0):
+            G += res
+        return G
+
+    def contract(self, factors, axes):
+        """
+        Equivalent to ``_contract_factors(X, factors, axes)``.
+
+        Slabs along the first mode are stacked if that mode is kept and
+        summed if it is contracted.
+        """
+        axes = [a + self.ndim if a < 0 else a for a in axes]
+
+        def slab_contract(start, stop, slab):
+            slab_factors = [U[start:stop] if a == 0 else U
+                            for U, a in zip(factors, axes)]
+            return _contract_factors(slab, slab_factors, axes)
+
+        res = None
+        for start, stop, T in self.map(slab_contract):
+            if 0 not in axes:
+                if res is None:
+                    res = np.empty((self.shape[0],) + T.shape[1:])
+                res[start:stop] = T
+            elif res is None:
+                res = T
+            else:
+                res += T
+        return res
+
+    def mttkrp(self, factors, axis):
+        """
+        Equivalent to ``mttkrp(X, factors, axis)``.
+        """
+        if axis < 0:
+            axis = self.ndim + axis
+        others = [n for n in range(self.ndim) if n != axis]
+        return self.contract([factors[n] for n in others], others)
+
+    def multi_tmult(self, matrices, axes):
+        """
+        Equivalent to ``multi_tmult(X, matrices, axes)``.
+        """
+        axes = [a + self.ndim if a < 0 else a for a in axes]
+
+        def slab_multi_tmult(start, stop, slab):
+            slab_matrices = [M[:, start:stop] if a == 0 else M
+                             for M, a in zip(matrices, axes)]
+            return multi_tmult(slab, slab_matrices, axes)
+
+        res = None
+        for start, stop, T in self.map(slab_multi_tmult):
+            if 0 not in axes:
+                if res is None:
+                    res = np.empty((self.shape[0],) + T.shape[1:])
+                res[start:stop] = T
+            elif res is None:
+                res = T
+            else:
+                res += T
+        return res
+
+
+class TensorSketch(object):
+    """
+    TensorSketch of the Khatri-Rao products and unfoldings of a tensor.
+
+    Every mode m has a hash h_m into ``sketch_size`` buckets and a random
+    sign s_m. Row (i_1, ..., i_n) of a Khatri-Rao product over a set of
+    modes, or column of an unfolding, is added with sign prod(s_m(i_m)) to
+    bucket sum(h_m(i_m)) modulo ``sketch_size``. The sketch of a Khatri-Rao
+    product is then the circular convolution of the count sketches of its
+    factors, computed with FFTs without forming the product (Pham & Pagh,
+    2013).
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the tensor.
+    sketch_size : int
+        Number of rows of every sketch.
+    random_state : int, None, or np.RandomState instance
+
+    """
+    def __init__(self, shape, sketch_size, random_state=None):
+        rs = check_random_state(random_state)
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.sketch_size = sketch_size
+        self.hashes = [rs.randint(sketch_size, size=d) for d in self.shape]
+        self.signs = [rs.randint(2, size=d) * 2. - 1. for d in self.shape]
+        # count sketch of mode m as a sparse [sketch_size, d_m] matrix
+        self._count_sketches = [
+            sparse.csr_matrix((s, (h, np.arange(d))), shape=(sketch_size, d))
+            for h, s, d in zip(self.hashes, self.signs, self.shape)]
+
+    def sketch_kr(self, factors, skip):
+        """
+        Sketch of the Khatri-Rao product of every factor but
+        ``factors[skip]``, of shape [sketch_size, n_components].
+
+        Rows are sketched consistently with the columns of
+        ``sketch_unfoldings(X)[skip]``.
+        """
+        if skip < 0:
+            skip = self.ndim + skip
+        res = None
+        for m in range(self.ndim):
+            if m == skip:
+                continue
+            F = np.fft.rfft(self._count_sketches[m].dot(factors[m]), axis=0)
+            res = F if res is None else res * F
+        return np.fft.irfft(res, n=self.sketch_size, axis=0)
+
+    def _add_entries(self, sketches, idx, values):
+        """
+        Add entries of X to the unfolding sketches, where idx holds the index
+        of the entries along every mode, broadcastable to values.
+        """
+        h = [self.hashes[m][i] for m, i in enumerate(idx)]
+        signed = values * reduce(np.multiply,
+                                 [self.signs[m][i] for m, i in enumerate(idx)])
+        total = reduce(np.add, h)
+        for n in range(self.ndim):
+            buckets = (total - h[n]) % self.sketch_size
+            index = np.broadcast_to(buckets * self.shape[n] + idx[n],
+                                    signed.shape)
+            weights = signed * self.signs[n][idx[n]]
+            sketches[n] += np.bincount(index.ravel(), weights=weights.ravel(),
+                                       minlength=sketches[n].size)
+
+    def sketch_unfoldings(self, X):
+        """
+        Sketch the transposed unfolding of X along every mode, in one pass.
+
+        Parameters
+        ----------
+        X : ndarray, SlabTensor or sparse tensor with ``coords`` and ``data``
+            Dense inputs are streamed slab by slab along their first mode,
+            and sparse inputs only visit their stored entries.
+
+        Returns
+        -------
+        sketches : list of ndarray, length = X.ndim
+            Sketch of ``matricize(X, n).T`` for every mode n, of shape
+            [sketch_size, X.shape[n]].
+        """
+        sketches = [np.zeros(self.sketch_size * d) for d in self.shape]
+        if hasattr(X, "coords"):
+            self._add_entries(sketches, list(X.coords), X.data)
+        else:
+            if not isinstance(X, SlabTensor):
+                X = SlabTensor(X)
+            for start, stop, slab in X.slabs(0):
+                idx = [np.arange(d).reshape((-1,) + (1,) * (self.ndim - m - 1))
+                       for m, d in enumerate(slab.shape)]
+                idx[0] = idx[0] + start
+                self._add_entries(sketches, idx, slab)
+        return [S.reshape(self.sketch_size, d)
+                for S, d in zip(sketches, self.shape)]
@@ -0,0 +1,346 @@
+"""Sparse tensor storage and kernels for tensor decomposition."""
+# License: BSD 3-Clause
+import numpy as np
+from scipy import sparse
+
+
+class COOTensor(object):
+    """
+    Sparse tensor in coordinate format.
+
+    Parameters
+    ----------
+    coords : array-like, shape = [ndim, nnz]
+        Index of every stored entry along each mode. Coordinates are assumed
+        to be unique.
+    data : array-like, shape = [nnz]
+        Value of every stored entry.
+    shape : tuple of int or None, optional (default=None)
+        Shape of the tensor. If None, the smallest shape holding every
+        stored entry is used.
+
+    Attributes
+    ----------
+    shape : tuple of int
+    ndim : int
+    nnz : int
+        Number of stored entries.
+    dtype : np.dtype
+
+    """
+    def __init__(self, coords, data, shape=None):
+        coords = np.asarray(coords, dtype=np.intp)
+        data = np.asarray(data)
+        if coords.ndim != 2 or data.ndim != 1 or \
+                coords.shape[1] != data.shape[0]:
+            raise ValueError("coords must have shape [ndim, nnz] and data "
+                             "shape [nnz]")
+        if shape is None:
+            shape = tuple(int(c.max()) + 1 if len(c) > 0 else 0
+                          for c in coords)
+        shape = tuple(int(d) for d in shape)
+        if len(shape) != coords.shape[0]:
+            raise ValueError("shape must have one entry per row of coords")
+        if coords.shape[1] > 0 and (np.any(coords.min(axis=1) < 0) or
+                                    np.any(coords.max(axis=1) >= shape)):
+            raise ValueError("coords out of bounds for shape %s" % (shape,))
+        self.coords = coords
+        self.data = data
+        self.shape = shape
+        self.ndim = len(shape)
+        self.nnz = len(data)
+        self.dtype = data.dtype
+
+    @classmethod
+    def from_dense(cls, X):
+        """
+        Build a COOTensor from the nonzero entries of a dense array.
+        """
+        X = np.asarray(X)
+        coords = np.array(np.nonzero(X), dtype=np.intp).reshape(X.ndim, -1)
+        return cls(coords, X[tuple(coords)], X.shape)
+
+    def todense(self):
+        """
+        Return the tensor as a dense ndarray.
+        """
+        X = np.zeros(self.shape, dtype=self.dtype)
+        X[tuple(self.coords)] = self.data
+        return X
+
+    def norm(self):
+        """
+        Frobenius norm of the tensor.
+        """
+        return np.sqrt(np.sum(self.data ** 2.))
+
+    def sq_norm(self):
+        """
+        Squared Frobenius norm of the tensor.
+        """
+        return np.sum(self.data ** 2.)
+
+    def unfold(self, axis):
+        """
+        Sparse equivalent of ``matricize(X, axis)``, as a CSR matrix.
+        """
+        if axis < 0:
+            axis = self.ndim + axis
+        # matricize orders the remaining modes with the last one slowest
+        others = [n for n in range(self.ndim) if n != axis][::-1]
+        cols = np.ravel_multi_index(tuple(self.coords[others]),
+                                    tuple(self.shape[n] for n in others))
+        n_cols = int(np.prod([self.shape[n] for n in others]))
+        return sparse.csr_matrix((self.data, (self.coords[axis], cols)),
+                                 shape=(self.shape[axis], n_cols))
+
+    def gram(self, axis):
+        """
+        Equivalent to ``matricize(X, axis).dot(matricize(X, axis).T)``,
+        returned as a dense array.
+        """
+        U = self.unfold(axis)
+        return U.dot(U.T).toarray()
+
+    def mttkrp(self, factors, axis):
+        """
+        Equivalent to ``sparse_mttkrp(X, factors, axis)``.
+        """
+        return sparse_mttkrp(self, factors, axis)
+
+    def multi_tmult(self, matrices, axes):
+        """
+        Equivalent to ``multi_tmult(X.todense(), matrices, axes)``.
+
+        Every stored entry forms the Kronecker product of its rows of the
+        transposed matrices, and the products are summed over the entries
+        sharing their coordinates along the remaining axes. Memory is
+        proportional to the number of stored entries times the product of
+        the numbers of rows of the matrices.
+        """
+        axes = [a + self.ndim if a < 0 else a for a in axes]
+        if len(matrices) != len(axes) or len(set(axes)) != len(axes):
+            raise ValueError("One distinct axis per matrix is required")
+        steps = sorted(zip(axes, matrices), key=lambda s: s[0])
+        K = self.data[:, None]
+        for axis, M in steps:
+            if M.ndim != 2 or M.shape[1] != self.shape[axis]:
+                raise ValueError("M must be a matrix with %i columns to "
+                                 "multiply axis %i of X"
+                                 % (self.shape[axis], axis))
+            rows = M.T[self.coords[axis]]
+            K = (K[:, :, None] * rows[:, None, :]).reshape(self.nnz, -1)
+        ranks = [M.shape[0] for _, M in steps]
+        kept = [n for n in range(self.ndim) if n not in axes]
+        if len(kept) == 0:
+            return K.sum(axis=0).reshape(ranks)
+        kept_shape = [self.shape[n] for n in kept]
+        rows = np.ravel_multi_index(tuple(self.coords[kept]), kept_shape)
+        P = sparse.csr_matrix((np.ones(self.nnz), (rows, np.arange(self.nnz))),
+                              shape=(int(np.prod(kept_shape)), self.nnz))
+        Y = np.asarray(P.dot(K)).reshape(kept_shape + ranks)
+        return Y.transpose(np.argsort(kept + [s[0] for s in steps]))
+
+    def values_at(self, factors):
+        """
+        Values of the CP model given by factors at the stored coordinates.
+        """
+        W = _gather_rows(self, factors, None)
+        return W.sum(axis=1)
+
+
+def _gather_rows(X, factors, skip, weights=None):
+    """
+    Elementwise product of the factor rows indexed by every stored entry,
+    over all modes except ``skip``.
+    """
+    W = None
+    for n in range(X.ndim):
+        if n == skip:
+            continue
+        rows = factors[n][X.coords[n]]
+        W = rows if W is None else W * rows
+    if weights is not None:
+        W = W * weights[:, None]
+    return W
+
+
+def sparse_mttkrp(X, factors, axis):
+    """
+    Matricized tensor times Khatri-Rao product for a sparse tensor.
+
+    Every stored entry gathers its rows of the factor matrices, and the
+    products are summed into the rows of the result with a bincount, so the
+    cost is proportional to the number of stored entries.
+
+    Parameters
+    ----------
+    X : COOTensor, shape = [d1, ..., dn]
+    factors : list of ndarray, length = X.ndim
+        Factor matrices, each of shape [X.shape[idx], n_components].
+        ``factors[axis]`` is ignored.
+    axis : int
+
+    Returns
+    -------
+    M : ndarray, shape = [d_axis, n_components]
+
+    """
+    if axis < 0:
+        axis = X.ndim + axis
+    if len(factors) != X.ndim:
+        raise ValueError("One factor per mode of X is required")
+    for n in range(X.ndim):
+        if n != axis and factors[n].shape[0] != X.shape[n]:
+            raise ValueError("Factor %i does not match mode %i of X" % (n, n))
+    W = _gather_rows(X, factors, axis, weights=X.data)
+    res = np.empty((X.shape[axis], W.shape[1]))
+    for r in range(W.shape[1]):
+        res[:, r] = np.bincount(X.coords[axis], weights=W[:, r],
+                                minlength=X.shape[axis])
+    return res
+
+
+class CSFTensor(object):
+    """
+    Compressed sparse fiber (CSF) tree of a sparse tensor.
+
+    The stored entries are sorted along ``mode_order`` and grouped into a
+    tree whose level l holds one node per distinct prefix of the first l + 1
+    coordinates. Products of factor rows along a shared prefix are then
+    computed once per node instead of once per stored entry.
+
+    Parameters
+    ----------
+    X : COOTensor
+    mode_order : list of int or None, optional (default=None)
+        Modes from the root of the tree to its leaves. If None, modes are
+        ordered by increasing size, which maximizes the sharing near the
+        root.
+
+    Attributes
+    ----------
+    nbytes : int
+        Number of bytes used by the tree.
+
+    """
+    def __init__(self, X, mode_order=None):
+        if mode_order is None:
+            mode_order = sorted(range(X.ndim), key=lambda n: X.shape[n])
+        mode_order = list(mode_order)
+        if sorted(mode_order) != list(range(X.ndim)):
+            raise ValueError("mode_order must be a permutation of the modes "
+                             "of X")
+        if X.nnz == 0:
+            raise ValueError("X has no stored entries")
+        self.shape = X.shape
+        self.ndim = X.ndim
+        self.mode_order = mode_order
+        perm = np.lexsort(X.coords[mode_order[::-1]])
+        coords = X.coords[mode_order][:, perm]
+        self.data = X.data[perm]
+
+        # fids[l] holds the index of each level l node along mode_order[l],
+        # and the children of node i are fptr[l][i]:fptr[l][i + 1]
+        self.fids = []
+        self.fptr = []
+        changed = np.zeros(max(X.nnz - 1, 0), dtype=bool)
+        starts = []
+        for l in range(X.ndim):
+            changed |= coords[l][1:] != coords[l][:-1]
+            starts.append(np.r_[0, np.flatnonzero(changed) + 1])
+            self.fids.append(coords[l][starts[l]])
+        for l in range(X.ndim - 1):
+            self.fptr.append(np.r_[np.searchsorted(starts[l + 1], starts[l]),
+                                   len(starts[l + 1])])
+        # stored entries with repeated coordinates are summed into one leaf
+        self.data = np.add.reduceat(self.data, starts[-1])
+
+    @property
+    def nbytes(self):
+        return (self.data.nbytes + sum(f.nbytes for f in self.fids) +
+                sum(f.nbytes for f in self.fptr))
+
+    def mttkrp(self, factors, axis):
+        """
+        Equivalent to ``sparse_mttkrp(X, factors, axis)``.
+
+        Products of the factors above the level of ``axis`` are pushed down
+        the tree and sums of the subtrees below it are pulled up, then the
+        two meet at the nodes of that level.
+        """
+        if axis < 0:
+            axis = self.ndim + axis
+        order = self.mode_order
+        depth = order.index(axis)
+        n_components = factors[order[1] if depth == 0 else order[0]].shape[1]
+
+        # sums over the subtrees below each node of level depth
+        below = self.data[:, None]
+        for l in range(self.ndim - 1, depth, -1):
+            below = below * factors[order[l]][self.fids[l]]
+            below = np.add.reduceat(below, self.fptr[l - 1][:-1], axis=0)
+        # products of the factors above each node of level depth
+        above = None
+        for l in range(depth):
+            rows = factors[order[l]][self.fids[l]]
+            above = rows if above is None else above * rows
+            above = np.repeat(above, np.diff(self.fptr[l]), axis=0)
+        W = below if above is None else above * below
+        W = np.broadcast_to(W, (len(self.fids[depth]), n_components))
+        res = np.empty((self.shape[axis], n_components))
+        for r in range(n_components):
+            res[:, r] = np.bincount(self.fids[depth], weights=W[:, r],
+                                    minlength=self.shape[axis])
+        return res
+
+
+class CSFMTTKRP(object):
+    """
+    MTTKRP engine for a sparse tensor, backed by lazily built CSF trees.
+
+    Parameters
+    ----------
+    X : COOTensor
+    factors : list of ndarray, length = X.ndim
+        Initial factor matrices, each of shape [X.shape[idx], n_components].
+    csf : string, optional (default="per_mode")
+        "per_mode" keeps one tree rooted at each mode, which is fastest as
+        every MTTKRP is a single bottom-up pass. "single" keeps one tree for
+        all modes, using a fraction of the memory.
+
+    Attributes
+    ----------
+    nbytes : int
+        Number of bytes used by the CSF trees built so far.
+
+    """
+    def __init__(self, X, factors, csf="per_mode"):
+        if csf not in ("per_mode", "single"):
+            raise ValueError("csf must be 'per_mode' or 'single', got %r"
+                             % csf)
+        self.X = X
+        self.factors = list(factors)
+        self.csf = csf
+        self._trees = {}
+
+    @property
+    def nbytes(self):
+        return sum(t.nbytes for t in self._trees.values())
+
+    def update(self, axis, factor):
+        self.factors[axis] = factor
+
+    def mttkrp(self, axis):
+        if axis < 0:
+            axis = self.X.ndim + axis
+        key = axis if self.csf == "per_mode" else None
+        if key not in self._trees:
+            if self.csf == "per_mode":
+                others = sorted((n for n in range(self.X.ndim) if n != axis),
+                                key=lambda n: self.X.shape[n])
+                order = [axis] + others
+            else:
+                order = None
+            self._trees[key] = CSFTensor(self.X, order)
+        return self._trees[key].mttkrp(self.factors, axis)
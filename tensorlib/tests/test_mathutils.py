@@ -1,7 +1,11 @@
 import numpy as np
+from functools import reduce
 from numpy.testing import assert_array_almost_equal, assert_raises
-from tensorlib.mathutils import kr, _canonical_kr
-from tensorlib.mathutils import matricize, unmatricize, tmult
+from tensorlib.mathutils import kr, kr_many, _canonical_kr
+from tensorlib.mathutils import matricize, unmatricize, tmult, mttkrp
+from tensorlib.mathutils import multi_tmult
+from tensorlib.mathutils import DimensionTree, UnfoldingCache
+from tensorlib.mathutils import SlabTensor, TensorSketch
 
 
 def test_kr():
@@ -68,3 +72,192 @@ def test_tmult():
     X2 = np.arange(9).reshape(3, 3)
     tmult(X1, X2, 1)
     assert_raises(ValueError, tmult, X1, X2, 0)
+
+
+def test_mttkrp():
+    """
+    Test MTTKRP against the explicit Khatri-Rao product form.
+    """
+    rs = np.random.RandomState(1999)
+    X = rs.randn(3, 4, 5, 2)
+    factors = [rs.randn(d, 3) for d in X.shape]
+    for i in range(X.ndim):
+        others = [factors[n] for n in range(X.ndim) if n != i]
+        p = reduce(kr, others[:-1][::-1], others[-1])
+        assert_array_almost_equal(mttkrp(X, factors, i),
+                                  matricize(X, i).dot(p))
+    assert_array_almost_equal(mttkrp(X, factors, -1), mttkrp(X, factors, 3))
+    assert_raises(ValueError, mttkrp, X, factors[:-1], 0)
+    assert_raises(ValueError, mttkrp, X, factors[::-1], 0)
+
+
+def test_dimension_tree():
+    """
+    Test memoized MTTKRP against direct MTTKRP through factor updates.
+    """
+    rs = np.random.RandomState(1999)
+    X = rs.randn(3, 4, 5, 2, 3)
+    factors = [rs.randn(d, 2) for d in X.shape]
+    tree = DimensionTree(X, factors)
+    assert tree.nbytes == 0
+    for sweep in range(2):
+        for i in range(X.ndim):
+            assert_array_almost_equal(tree.mttkrp(i), mttkrp(X, factors, i))
+            factors[i] = rs.randn(X.shape[i], 2)
+            tree.update(i, factors[i])
+    assert tree.nbytes > 0
+    assert_raises(ValueError, DimensionTree, X, factors[:-1])
+
+    # the root contractions of a SlabTensor stream over its slabs
+    S = SlabTensor(X, chunk_size=4 * 5 * 2 * 3 * 8, n_jobs=2)
+    tree = DimensionTree(S, factors)
+    for i in range(X.ndim):
+        assert_array_almost_equal(tree.mttkrp(i), mttkrp(X, factors, i))
+    assert S.n_passes == 2
+
+
+def test_unfolding_cache():
+    """
+    Test cached unfoldings, views and LRU eviction.
+    """
+    X = np.arange(2 * 3 * 4).reshape(2, 3, 4).astype(float)
+    cache = UnfoldingCache(X)
+    for i in range(X.ndim):
+        assert_array_almost_equal(cache.unfold(i), matricize(X, i))
+    assert cache.unfold(1) is cache.unfold(-2)
+
+    # the leading mode of a Fortran ordered tensor needs no copy
+    cache = UnfoldingCache(np.asfortranarray(X))
+    assert np.may_share_memory(cache.unfold(0), cache.X)
+    assert cache.nbytes == 0
+
+    cache = UnfoldingCache(X, max_bytes=X.nbytes)
+    cache.unfold(1)
+    cache.unfold(2)
+    assert cache.nbytes == X.nbytes
+    assert_array_almost_equal(cache.unfold(1), matricize(X, 1))
+    cache = UnfoldingCache(X, max_bytes=0)
+    cache.unfold(1)
+    assert cache.nbytes == 0
+
+
+def test_tmult_matricized():
+    """
+    Test tmult against the matricized definition and the out buffer.
+    """
+    rs = np.random.RandomState(1999)
+    X = rs.randn(3, 4, 5, 2)
+    for i in range(X.ndim):
+        M = rs.randn(6, X.shape[i])
+        shape = list(X.shape)
+        shape[i] = 6
+        expected = unmatricize(M.dot(matricize(X, i)), i, shape)
+        assert_array_almost_equal(tmult(X, M, i), expected)
+        out = np.empty(shape)
+        assert tmult(X, M, i, out=out) is out
+        assert_array_almost_equal(out, expected)
+    assert_array_almost_equal(tmult(X, M, -1), tmult(X, M, 3))
+    assert_raises(ValueError, tmult, X, M, 3, np.empty((3, 4, 5, 2)))
+
+
+def test_multi_tmult():
+    rs = np.random.RandomState(1999)
+    X = rs.randn(3, 4, 5, 2)
+    matrices = [rs.randn(2, 3), rs.randn(7, 5), rs.randn(1, 2)]
+    axes = [0, 2, -1]
+    expected = X
+    for M, axis in zip(matrices, axes):
+        expected = tmult(expected, M, axis)
+    assert_array_almost_equal(multi_tmult(X, matrices, axes), expected)
+    assert_raises(ValueError, multi_tmult, X, matrices, [0, 2])
+    assert_raises(ValueError, multi_tmult, X, matrices, [0, 2, 0])
+    assert_raises(ValueError, multi_tmult, X, matrices, [1, 2, 3])
+
+
+def test_kr_many():
+    """
+    Test the multi-matrix Khatri-Rao product against pairwise products.
+    """
+    rs = np.random.RandomState(1999)
+    matrices = [rs.randn(d, 3) for d in (2, 4, 3, 5)]
+    expected = reduce(kr, matrices)
+    assert_array_almost_equal(kr_many(matrices), expected)
+    assert_array_almost_equal(kr_many(matrices[:1]), matrices[0])
+    out = np.empty_like(expected)
+    assert kr_many(matrices, out=out) is out
+    assert_array_almost_equal(out, expected)
+    blocks = list(kr_many(matrices, row_block=7))
+    assert max(len(b) for b in blocks) == 7
+    assert_array_almost_equal(np.vstack(blocks), expected)
+    assert_raises(ValueError, kr_many, [])
+    assert_raises(ValueError, kr_many, [rs.randn(2, 3), rs.randn(2, 2)])
+    assert_raises(ValueError, kr_many, matrices, out=np.empty((3, 3)))
+
+
+def test_slab_tensor():
+    """
+    Test streamed operations against their in-memory equivalents.
+    """
+    rs = np.random.RandomState(1999)
+    X = rs.randn(7, 4, 5)
+    # 3 indices of the first mode per slab
+    S = SlabTensor(X, chunk_size=3 * 4 * 5 * 8)
+    assert [stop - start for start, stop, _ in S.slabs()] == [3, 3, 1]
+    assert len(S.throughput) == 3
+    assert_array_almost_equal(S.sq_norm(), np.sum(X ** 2))
+    factors = [rs.randn(d, 2) for d in X.shape]
+    matrices = [rs.randn(2, d) for d in X.shape]
+    for i in range(X.ndim):
+        U = matricize(X, i)
+        assert_array_almost_equal(S.gram(i), U.dot(U.T))
+        assert_array_almost_equal(S.mttkrp(factors, i), mttkrp(X, factors, i))
+        axes = [n for n in range(X.ndim) if n != i]
+        M = [matrices[n] for n in axes]
+        assert_array_almost_equal(S.multi_tmult(M, axes),
+                                  multi_tmult(X, M, axes))
+    # same results when the slabs are processed on a thread pool
+    P = SlabTensor(X, chunk_size=3 * 4 * 5 * 8, n_jobs=3)
+    assert_array_almost_equal(P.sq_norm(), np.sum(X ** 2))
+    for i in range(X.ndim):
+        assert_array_almost_equal(P.gram(i), S.gram(i))
+        assert_array_almost_equal(P.mttkrp(factors, i), S.mttkrp(factors, i))
+        axes = [n for n in range(X.ndim) if n != i]
+        M = [matrices[n] for n in axes]
+        assert_array_almost_equal(P.multi_tmult(M, axes),
+                                  S.multi_tmult(M, axes))
+    assert len(P.throughput) == 3
+    assert P.n_passes > 0 and P.wall_time > 0
+    # one pool serves every pass until the tensor is closed
+    pool = P._pool
+    P.sq_norm()
+    assert pool is not None and P._pool is pool
+    P.close()
+    assert P._pool is None
+    assert_array_almost_equal(P.sq_norm(), np.sum(X ** 2))
+    P.close()
+
+
+def test_tensor_sketch():
+    """
+    Test TensorSketches against the explicit sketching matrices.
+    """
+    rs = np.random.RandomState(1999)
+    X = rs.randn(4, 5, 6)
+    factors = [rs.randn(d, 2) for d in X.shape]
+    sketch_size = 7
+    T = TensorSketch(X.shape, sketch_size, random_state=0)
+    # slabs of two indices along the first mode
+    S = SlabTensor(X, chunk_size=2 * 5 * 6 * 8)
+    for Y in (T.sketch_unfoldings(X), T.sketch_unfoldings(S)):
+        for n in range(X.ndim):
+            # matricize orders the remaining modes with the last one slowest
+            others = [m for m in range(X.ndim) if m != n][::-1]
+            buckets = reduce(np.add.outer, [T.hashes[m] for m in others])
+            signs = reduce(np.multiply.outer, [T.signs[m] for m in others])
+            P = np.zeros((sketch_size, buckets.size))
+            P[buckets.ravel() % sketch_size,
+              np.arange(buckets.size)] = signs.ravel()
+            assert_array_almost_equal(Y[n], P.dot(matricize(X, n).T))
+            assert_array_almost_equal(
+                T.sketch_kr(factors, n),
+                P.dot(kr_many([factors[m] for m in others])))
@@ -0,0 +1,87 @@
+import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_raises
+from tensorlib.sparse import COOTensor, sparse_mttkrp
+from tensorlib.sparse import CSFTensor, CSFMTTKRP
+from tensorlib.mathutils import matricize, mttkrp, multi_tmult
+
+
+def _sparse_random(rs, shape, density=0.2):
+    X = rs.randn(*shape)
+    X[rs.rand(*shape) > density] = 0
+    return X
+
+
+def test_coo_tensor():
+    rs = np.random.RandomState(1999)
+    X = _sparse_random(rs, (3, 4, 5))
+    S = COOTensor.from_dense(X)
+    assert S.shape == X.shape
+    assert S.ndim == 3
+    assert S.nnz == np.count_nonzero(X)
+    assert_array_almost_equal(S.todense(), X)
+    assert_array_almost_equal(S.norm(), np.sqrt(np.sum(X ** 2)))
+    S2 = COOTensor(S.coords, S.data)
+    assert all(d2 <= d for d2, d in zip(S2.shape, S.shape))
+    assert_raises(ValueError, COOTensor, S.coords, S.data[:-1])
+    assert_raises(ValueError, COOTensor, S.coords, S.data, (3, 4))
+    assert_raises(ValueError, COOTensor, S.coords, S.data, (1, 1, 1))
+
+
+def test_sparse_unfold():
+    rs = np.random.RandomState(1999)
+    X = _sparse_random(rs, (3, 4, 5, 2))
+    S = COOTensor.from_dense(X)
+    for i in range(X.ndim):
+        U = matricize(X, i)
+        assert_array_almost_equal(S.unfold(i).toarray(), U)
+        assert_array_almost_equal(S.gram(i), U.dot(U.T))
+
+
+def test_sparse_mttkrp():
+    rs = np.random.RandomState(1999)
+    X = _sparse_random(rs, (3, 4, 5, 2))
+    S = COOTensor.from_dense(X)
+    factors = [rs.randn(d, 3) for d in X.shape]
+    for i in range(X.ndim):
+        assert_array_almost_equal(sparse_mttkrp(S, factors, i),
+                                  mttkrp(X, factors, i))
+    assert_array_almost_equal(S.mttkrp(factors, -1), mttkrp(X, factors, 3))
+    assert_raises(ValueError, sparse_mttkrp, S, factors[:-1], 0)
+
+
+def test_csf_mttkrp():
+    rs = np.random.RandomState(1999)
+    X = _sparse_random(rs, (3, 4, 5, 2), density=0.4)
+    S = COOTensor.from_dense(X)
+    factors = [rs.randn(d, 3) for d in X.shape]
+    for order in (None, [0, 1, 2, 3], [3, 1, 0, 2]):
+        T = CSFTensor(S, order)
+        assert T.nbytes > 0
+        for i in range(X.ndim):
+            assert_array_almost_equal(T.mttkrp(factors, i),
+                                      mttkrp(X, factors, i))
+    assert_raises(ValueError, CSFTensor, S, [0, 1, 1, 2])
+
+    for csf in ("per_mode", "single"):
+        engine = CSFMTTKRP(S, factors, csf=csf)
+        for i in range(X.ndim):
+            factors[i] = rs.randn(X.shape[i], 3)
+            engine.update(i, factors[i])
+            j = (i + 1) % X.ndim
+            assert_array_almost_equal(engine.mttkrp(j),
+                                      mttkrp(X, factors, j))
+    assert len(CSFMTTKRP(S, factors, "per_mode")._trees) == 0
+    assert_raises(ValueError, CSFMTTKRP, S, factors, "invalid")
+
+
+def test_sparse_multi_tmult():
+    rs = np.random.RandomState(1999)
+    X = _sparse_random(rs, (3, 4, 5, 2), density=0.4)
+    S = COOTensor.from_dense(X)
+    matrices = [rs.randn(2, d) for d in X.shape]
+    for axes in ([0, 1, 2, 3], [1, 3, 0], [2], [-1, 1]):
+        M = [matrices[a] for a in axes]
+        assert_array_almost_equal(S.multi_tmult(M, axes),
+                                  multi_tmult(X, M, axes))
+    assert_raises(ValueError, S.multi_tmult, matrices[:2], [0, 0])
+    assert_raises(ValueError, S.multi_tmult, matrices[:1], [1])
@@ -2,6 +2,7 @@ import numpy as np
 from tensorlib.utils import check_random_state
 from tensorlib.utils import check_tensor
 from tensorlib.utils import download
+from tensorlib.utils import effective_n_jobs, limit_blas_threads
 from nose.tools import assert_raises
 from nose.plugins.skip import SkipTest
 
@@ -20,6 +21,16 @@ def test_random_state():
     assert_raises(ValueError, check_random_state, "invalid")
 
 
+def test_n_jobs():
+    from multiprocessing import cpu_count
+    assert effective_n_jobs(None) == 1
+    assert effective_n_jobs(4) == 4
+    assert effective_n_jobs(-1) == cpu_count()
+    assert_raises(ValueError, effective_n_jobs, 0)
+    with limit_blas_threads(1):
+        np.dot(np.ones((2, 2)), np.ones((2, 2)))
+
+
 def test_downloader():
     raise SkipTest
     download("https://dl.dropboxusercontent.com/u/15378192/Sensory_Bread.zip",
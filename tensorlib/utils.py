@@ -4,10 +4,15 @@
 
 import numpy as np
 import numbers
+from multiprocessing import cpu_count
 try:
     import urllib.request as urllib  # for backwards compatibility
 except ImportError:
     import urllib2 as urllib
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
 
 
 def check_tensor(X):
@@ -33,6 +38,43 @@ def check_random_state(seed):
                      ' instance' % seed)
 
 
+def effective_n_jobs(n_jobs):
+    """
+    Number of workers to use for n_jobs, where negative values count back
+    from the number of cores (-1 uses all of them).
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs == 0:
+        raise ValueError("n_jobs == 0 has no meaning")
+    if n_jobs < 0:
+        return max(cpu_count() + 1 + n_jobs, 1)
+    return n_jobs
+
+
+class limit_blas_threads(object):
+    """
+    Context manager capping the number of BLAS threads.
+
+    Relies on the optional threadpoolctl package, and does nothing when it
+    is not installed or when limit is None.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self._limiter = None
+
+    def __enter__(self):
+        if self.limit is not None and threadpool_limits is not None:
+            self._limiter = threadpool_limits(limits=self.limit,
+                                              user_api="blas")
+        return self
+
+    def __exit__(self, *args):
+        if self._limiter is not None:
+            self._limiter.restore_original_limits()
+            self._limiter = None
+
+
 def download(url, server_fname, local_fname=None, progress_update_every=5):
     """
     An internet download utility modified from